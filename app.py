@@ -1,16 +1,21 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import logging
 import pandas as pd
-import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
 import os
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output, State
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
 from flask import Flask
-from stocktools.json_to_df import json_to_df
+from stocktools.figure_cache import FigureCache
+from stocktools.frame_cache import cached_json_to_df
+from stocktools.plotting import OVERLAYS, STYLES, relayout_range
+from stocktools.store import compact_directory
+from stocktools import timing
 from datetime import datetime as dt
 from datetime import timedelta
 
@@ -28,6 +33,8 @@ from datetime import timedelta
 # add volume to OHLC chart
 # use media queries to center based on display-size
 
+log = logging
+
 colors = {
     'background': '#00336c',
     'text': '#e2efff'
@@ -50,13 +57,11 @@ dropdown_options = [
 # f3f3f1
 external_stylesheets = [dbc.themes.BOOTSTRAP, "/assets/style.css"]
 
-server = Flask(__name__)
-
-
-app = dash.Dash(__name__, server=server,
+# the flask server is attached in create_app(), the layout and callbacks
+# below are registered on the dash app either way
+app = dash.Dash(__name__, server=False,
                 external_stylesheets=external_stylesheets,)
 app.config.suppress_callback_exceptions = True
-app.server.config.suppress_callback_exceptions = True
 app.config['suppress_callback_exceptions'] = True
 
 SIDEBAR_STYLE = {
@@ -131,8 +136,26 @@ stocks_selection_html = html.Div(className="plot_selection_panel pretty_containe
                                                   options=dropdown_options,
                                                   value='AAPL'
                                                   ),
+                                     dcc.Checklist(id='overlayChecklist',
+                                                   options=[{'label': name, 'value': name}
+                                                            for name in OVERLAYS],
+                                                   value=list(OVERLAYS),
+                                                   labelStyle={'display': 'inline-block',
+                                                               'margin-right': '1rem'},
+                                                   ),
+                                     dcc.RadioItems(id='chartStyle',
+                                                    options=[{'label': style.capitalize(),
+                                                              'value': style}
+                                                             for style in STYLES],
+                                                    value='candlestick',
+                                                    labelStyle={'display': 'inline-block',
+                                                                'margin-right': '1rem'},
+                                                    ),
                                      html.Div(
                                          [
+                                             # the arrays of the current view, drawn
+                                             # by the clientside callback below
+                                             dcc.Store(id='ohlc_store'),
                                              dcc.Graph(id='main_graph')
                                          ],
                                          className='pretty_container plot_panel_size',
@@ -142,6 +165,47 @@ stocks_selection_html = html.Div(className="plot_selection_panel pretty_containe
                                  ])
 
 
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/data_raw')
+figure_cache = FigureCache(DATA_DIR)
+
+
+def warm_figure_cache():
+    # the dropdown's symbols at their default view
+    figure_cache.warm([option['value'] for option in dropdown_options])
+
+
+def preload_data():
+    # the dropdown's frames and default figures. Under gunicorn's
+    # preload_app this runs once in the master, the forked workers share
+    # the frames copy-on-write and the figures through the file cache.
+    # Columnar store copies of new or updated json first, the frames and
+    # the date-range reads load from those
+    compact_directory(DATA_DIR, stale_only=True)
+    for option in dropdown_options:
+        file_name = f"data_{option['value'].lower()}.json"
+        cached_json_to_df(file_name, path=os.path.join(DATA_DIR, file_name))
+    warm_figure_cache()
+
+
+def create_app(debug: bool = False, preload: bool = True) -> Flask:
+    """
+    Builds the flask server the dash app is served from, for a wsgi server:
+
+        gunicorn -c gunicorn.conf.py wsgi:server
+
+    The dash app can only be attached to one server, call this once per
+    process.
+    """
+    server = Flask(__name__)
+    server.config.update(DEBUG=debug, suppress_callback_exceptions=True)
+    app.init_app(server)
+    # Server-Timing headers and /metrics when STOCKTOOLS_TIMING=1
+    timing.install(server)
+    if preload:
+        preload_data()
+    return server
+
+
 app.layout = html.Div([side_navbar,
                        dbc.Container(id="page-content", className="pt-4"),
 
@@ -191,98 +255,39 @@ def render_page_content(pathname):
 
 
 @app.callback(
+    Output('ohlc_store', 'data'),
+    [Input('symbolDropdown', 'value'),
+     Input('main_graph', 'relayoutData')],
+)
+def render_ohlc_graph(symbolDropdown: str, relayoutData=None):
+    # only ship as many candles as the visible range can show, re-aggregated
+    # every time the range buttons / zoom change the x axis; every view is
+    # built once per data version and then served from the cache
+    x_range = relayout_range(relayoutData)
+    if x_range is None and relayoutData and 'main_graph.relayoutData' in [
+            trigger['prop_id'] for trigger in dash.callback_context.triggered]:
+        # autosize, legend clicks, ... nothing to refetch
+        raise PreventUpdate
+    log.debug("main_graph %s %s", symbolDropdown, x_range)
+    with timing.span('render_ohlc_graph'):
+        return figure_cache.get(symbolDropdown, x_range)
+
+
+# overlays and chart style are redrawn in the browser from the stored
+# arrays (assets/ohlc.js), without a round trip
+app.clientside_callback(
+    ClientsideFunction(namespace='stocks', function_name='render_ohlc'),
     Output('main_graph', 'figure'),
-    [Input('symbolDropdown', 'value')],
+    [Input('ohlc_store', 'data'),
+     Input('overlayChecklist', 'value'),
+     Input('chartStyle', 'value')],
 )
-def render_ohlc_graph(symbolDropdown: str):
-    print(symbolDropdown)
-    symbol_historical_data_path = os.path.join(os.path.dirname(
-        os.path.abspath(__file__)), f'data/data_raw/data_{symbolDropdown.lower()}.json')
-
-    co_df = json_to_df(f"data_{symbolDropdown.lower()}.json",
-                       path=symbol_historical_data_path)
-
-    title = f"{symbolDropdown.lower()} Historical Graph"
-    hovertext = []
-    for i in range(len(co_df['Open'])):
-        hovertext.append(
-            co_df['Date'][i].strftime("%m/%d/%Y") +
-            '<br>O: '+str(round(co_df['AdjOpen'][i], 4)) +
-            '\tH: '+str(round(co_df['AdjHigh'][i], 4)) +
-            '<br>L: '+str(round(co_df['AdjLow'][i], 4)) +
-            '\tC: '+str(co_df['AdjClose'][i]))
-
-    trace_ohlc = go.Candlestick(x=co_df['Date'],
-                                open=co_df['AdjOpen'],
-                                high=co_df['AdjHigh'],
-                                low=co_df['AdjLow'],
-                                close=co_df['AdjClose'],
-                                text=hovertext,
-                                hoverinfo='text',
-                                name="OHLC"
-                                # increasing_line_color='#0048BA',
-                                # decreasing_line_color='#E60000'
-                                )
-    trace_sma_20_day = go.Scatter(
-        x=co_df['Date'], y=co_df['SMA_20day'], name="SMA_20day", visible=True)
-    trace_ema_20_day = go.Scatter(
-        x=co_df['Date'], y=co_df['EMA_20day'], name="EMA_20day")
-
-    fig = go.Figure(data=[trace_ohlc, trace_sma_20_day, trace_ema_20_day],
-                    layout=go.Layout(
-        title=title,
-        # width=1200,
-        # height=600,
-        # plot_bgcolor=colors['background'],
-        paper_bgcolor='#F9F9F9',
-        xaxis_rangeslider_visible=True)
-    )
-    print(type(fig))
-
-    fig.update_xaxes(
-        rangebreaks=[
-            dict(bounds=["sat", "mon"]),  # hide weekends
-            # hide Christmas and New Year's
-            dict(values=["2015-12-25", "2016-01-01"])
-        ]
-    )
-
-    # Add range slider
-    fig.update_layout(
-        xaxis=dict(
-            rangeselector=dict(
-                buttons=list([
-                    dict(count=1,
-                         label="1m",
-                         step="month",
-                         stepmode="backward"),
-                    dict(count=6,
-                         label="6m",
-                         step="month",
-                         stepmode="backward"),
-                    dict(count=1,
-                         label="YTD",
-                         step="year",
-                         stepmode="todate"),
-                    dict(count=1,
-                         label="1y",
-                         step="year",
-                         stepmode="backward"),
-                    dict(step="all")
-                ])
-            ),
-            rangeslider=dict(
-                visible=False
-            ),
-            type="date"
-        )
-    )
-
-    return fig
 
 
 if __name__ == "__main__":
 
+    # development server, see wsgi.py for production
+    server = create_app(debug=True)
     app.run_server(debug=True, use_reloader=True)
 
     # fig.update_layout(title="AAPL Stock", xaxis_rangeslider_visible=False)
@@ -0,0 +1,34 @@
+// Clientside half of the main_graph: the server puts a view's arrays in the
+// ohlc_store (stocktools.plotting.ohlc_data) and the figure is built here,
+// so toggling overlays or the chart style is handled in the browser.
+// Mirrors stocktools.plotting.ohlc_figure_from_data.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    stocks: {
+        render_ohlc: function (data, overlays, style) {
+            if (!data) {
+                return window.dash_clientside.no_update;
+            }
+            var hover = {xhoverformat: '%m/%d/%Y', yhoverformat: '.2f'};
+            var traces = [];
+            if (style === 'line') {
+                traces.push(Object.assign({
+                    type: 'scatter', name: 'AdjClose', x: data.x, y: data.close
+                }, hover));
+            } else {
+                traces.push(Object.assign({
+                    type: style || 'candlestick', name: 'OHLC', x: data.x,
+                    open: data.open, high: data.high, low: data.low, close: data.close
+                }, hover));
+            }
+            Object.keys(data.overlays).forEach(function (name) {
+                if ((overlays || []).indexOf(name) !== -1) {
+                    traces.push(Object.assign({
+                        type: 'scatter', name: name, x: data.x, y: data.overlays[name]
+                    }, hover));
+                }
+            });
+            return {data: traces, layout: data.layout};
+        }
+    }
+});
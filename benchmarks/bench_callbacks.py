@@ -0,0 +1,179 @@
+"""
+Latency and throughput of the dashboard callbacks, offline against
+data/data_raw:
+
+  direct: render_ohlc_graph, render_page_content and toggle_active_links
+          called in process, render_ohlc_graph both on an empty figure
+          cache (cold) and a warm one
+  http:   n_users simulated users switching symbols through the dash
+          /_dash-update-component endpoint of the app served by the dev
+          server (dev) or gunicorn with gunicorn.conf.py (gunicorn)
+
+Both report p50/p95/p99 latency, throughput and response bytes per symbol.
+
+    python -m benchmarks.bench_callbacks direct [repeat]
+    python -m benchmarks.bench_callbacks http [n_users] [duration_s] [dev|gunicorn]
+"""
+
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import logging
+import tempfile
+import subprocess
+from collections import defaultdict
+import aiohttp
+import numpy as np
+from dash._utils import to_json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_PORT = 8798
+
+# a zoom into the last year, what the range buttons send
+YEAR_VIEW = {'xaxis.range[0]': '2019-05-19', 'xaxis.range[1]': '2020-05-19'}
+
+
+def summary(label, latencies, elapsed=None, nbytes=None):
+    ms = np.asarray(latencies) * 1e3
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    line = (f"  {label:22}: p50 {p50:8.3f}ms  p95 {p95:8.3f}ms  p99 {p99:8.3f}ms  "
+            f"n={len(ms)}")
+    if elapsed:
+        line += f"  {len(ms) / elapsed:7.1f} req/s"
+    if nbytes is not None:
+        line += f"  {nbytes / 1024:6.1f} KiB"
+    print(line)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_direct(repeat=50):
+    sys.path.insert(0, ROOT)
+    import app
+    from stocktools.figure_cache import FigureCache
+    symbols = [option['value'] for option in app.dropdown_options]
+
+    # an empty cache in a scratch directory, the app's own is left alone
+    app.figure_cache = FigureCache(app.DATA_DIR, directory=tempfile.mkdtemp())
+    for view_name, relayout in (('all', None), ('1y', YEAR_VIEW)):
+        print(f"render_ohlc_graph, view {view_name}")
+        cold, warm = [], []
+        for symbol in symbols:
+            data, seconds = timed(app.render_ohlc_graph, symbol, relayout)
+            cold.append(seconds)
+            warm_symbol = [timed(app.render_ohlc_graph, symbol, relayout)[1]
+                           for _ in range(repeat)]
+            summary(symbol, warm_symbol, nbytes=len(to_json(data)))
+            warm.extend(warm_symbol)
+        summary('cold (first build)', cold)
+        summary('warm', warm)
+
+    print("page callbacks")
+    summary('render_page_content', [timed(app.render_page_content, '/stocks')[1]
+                                    for _ in range(repeat)])
+    summary('toggle_active_links', [timed(app.toggle_active_links, '/stocks')[1]
+                                    for _ in range(repeat)])
+
+
+def start_app_server(kind):
+    if kind == 'gunicorn':
+        command = ['gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:server',
+                   '--bind', f'127.0.0.1:{_PORT}']
+    else:
+        command = [sys.executable, '-c',
+                   'import app; app.create_app(); '
+                   f'app.app.run_server(port={_PORT}, debug=False)']
+    server = subprocess.Popen(command, cwd=ROOT,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # preloading the data takes a while
+    for _ in range(600):
+        try:
+            socket.create_connection(('127.0.0.1', _PORT), timeout=0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('app server did not start')
+
+
+def update_request(symbol):
+    # what the browser posts when the symbol dropdown changes
+    return {'output': 'ohlc_store.data',
+            'outputs': {'id': 'ohlc_store', 'property': 'data'},
+            'inputs': [{'id': 'symbolDropdown', 'property': 'value', 'value': symbol},
+                       {'id': 'main_graph', 'property': 'relayoutData', 'value': None}],
+            'changedPropIds': ['symbolDropdown.value']}
+
+
+async def post_update(session, url, symbol) -> bytes:
+    async with session.post(url, json=update_request(symbol)) as response:
+        body = await response.read()
+        response.raise_for_status()
+        return body
+
+
+async def user(session, url, symbols, offset, deadline, latencies, nbytes, errors):
+    # each user walks the dropdown from a different symbol
+    i = offset
+    while time.perf_counter() < deadline:
+        symbol = symbols[i % len(symbols)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            body = await post_update(session, url, symbol)
+        except aiohttp.ClientError:
+            # gunicorn recycling a worker drops its keep-alive connections
+            errors[symbol] += 1
+            continue
+        latencies[symbol].append(time.perf_counter() - start)
+        nbytes[symbol] = len(body)
+
+
+async def bench_http(n_users=16, duration=10.0, kind='dev'):
+    sys.path.insert(0, ROOT)
+    from app import dropdown_options
+    symbols = [option['value'] for option in dropdown_options]
+    url = f'http://127.0.0.1:{_PORT}/_dash-update-component'
+
+    server = start_app_server(kind)
+    latencies, nbytes, errors = defaultdict(list), {}, defaultdict(int)
+    try:
+        async with aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=n_users)) as session:
+            # one round to settle connections and caches
+            await asyncio.gather(*[post_update(session, url, symbol)
+                                   for symbol in symbols])
+            start = time.perf_counter()
+            await asyncio.gather(*[user(session, url, symbols, offset,
+                                        start + duration, latencies, nbytes, errors)
+                                   for offset in range(n_users)])
+            elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{kind} server, {n_users} users, {duration:.0f}s")
+    for symbol in symbols:
+        summary(symbol, latencies[symbol], nbytes=nbytes.get(symbol, 0))
+    summary('all', [seconds for values in latencies.values() for seconds in values],
+            elapsed=elapsed)
+    if errors:
+        print(f"  {sum(errors.values())} dropped connections")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'direct'
+    if mode == 'direct':
+        bench_direct(int(sys.argv[2]) if len(sys.argv) > 2 else 50)
+    else:
+        asyncio.run(bench_http(int(sys.argv[2]) if len(sys.argv) > 2 else 16,
+                               float(sys.argv[3]) if len(sys.argv) > 3 else 10.0,
+                               sys.argv[4] if len(sys.argv) > 4 else 'dev'))
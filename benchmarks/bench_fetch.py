@@ -0,0 +1,95 @@
+"""
+End-to-end bulk refresh throughput against the local stand-in server
+(stocktools.fake_server): fetch, decode and write N synthetic symbols,
+either json decoded to dicts and re-dumped (dict) or streamed into bars
+while the response is saved as a snapshot (stream, what FetchAlphaVantage does)
+
+    python -m benchmarks.bench_fetch [n_symbols] [latency_s] [error_rate] [dict|stream]
+"""
+
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import tempfile
+import logging
+import subprocess
+from stocktools.client import AlphaVantageClient
+from stocktools.rate_limit import RateLimiter
+from stocktools.alpha_vantage_v2 import FetchAlphaVantage
+from stocktools.store import store_path_for, write_store
+
+_PORT = 8799
+
+
+def start_fake_server(latency, error_rate):
+    # in its own process so serving doesn't compete with the client for the GIL
+    server = subprocess.Popen([sys.executable, '-m', 'stocktools.fake_server',
+                               '--port', str(_PORT), '--latency', str(latency),
+                               '--error-rate', str(error_rate)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', _PORT), timeout=0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('fake server did not start')
+
+
+async def fetch_dict(client, symbols, out_path):
+    results = await client.fetch_many(symbols)
+    for result in results:
+        if result.error is None:
+            FetchAlphaVantage._write_json_file(out_path, result.symbol, result.data)
+    return results
+
+
+async def fetch_stream(client, symbols, out_path):
+    async def fetch(symbol):
+        json_path = os.path.join(out_path, f'data_{symbol}.json')
+        result = await client.time_series_bars(symbol, raw_path=json_path)
+        if result.error is None:
+            write_store(result.data, store_path_for(json_path, out_path))
+        return result
+    return await asyncio.gather(*[fetch(symbol) for symbol in symbols])
+
+
+async def bench(n_symbols, latency, error_rate, mode='stream', max_connections=50):
+    server = start_fake_server(latency, error_rate)
+    symbols = [f'sym{i:05d}' for i in range(n_symbols)]
+    out_path = tempfile.mkdtemp()
+    # no quota on the stand-in, the limiter is only in the loop for realism
+    limiter = RateLimiter(per_minute=10 ** 9, per_day=10 ** 9)
+    client = AlphaVantageClient('bench', base_url=f'http://127.0.0.1:{_PORT}/query',
+                                rate_limiter=limiter, max_connections=max_connections,
+                                backoff=0.05)
+    try:
+        async with client:
+            start = time.perf_counter()
+            fetch = fetch_stream if mode == 'stream' else fetch_dict
+            results = await fetch(client, symbols, out_path)
+            elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    failed = sum(result.error is not None for result in results)
+    retries = sum(result.attempts - 1 for result in results)
+    written = sum(os.path.getsize(os.path.join(out_path, name))
+                  for name in os.listdir(out_path))
+    print(f"{mode}: {n_symbols} symbols in {elapsed:.2f}s: {n_symbols / elapsed:.1f} symbols/s, "
+          f"{written / elapsed / 2 ** 20:.1f} MiB/s written, "
+          f"{retries} retries, {failed} failed")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+    mode = sys.argv[4] if len(sys.argv) > 4 else 'stream'
+    asyncio.run(bench(n_symbols, latency, error_rate, mode))
@@ -0,0 +1,43 @@
+"""
+Hovertext construction, per-row loop vs stocktools.plotting.ohlc_hovertext
+
+    python -m benchmarks.bench_hovertext [symbol ...]
+"""
+
+
+import os
+import sys
+import timeit
+from stocktools.json_to_df import json_to_df
+from stocktools.plotting import ohlc_hovertext
+
+DATA_DIR = os.path.join(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))), 'data/data_raw')
+
+
+def loop_hovertext(co_df):
+    # the loop render_ohlc_graph, make_ohlc_graph and plot_ohlc used to run
+    hovertext = []
+    for i in range(len(co_df['Open'])):
+        hovertext.append(
+            co_df['Date'][i].strftime("%m/%d/%Y") +
+            '<br>O: '+str(round(co_df['AdjOpen'][i], 4)) +
+            '\tH: '+str(round(co_df['AdjHigh'][i], 4)) +
+            '<br>L: '+str(round(co_df['AdjLow'][i], 4)) +
+            '\tC: '+str(co_df['AdjClose'][i]))
+    return hovertext
+
+
+def bench(symbol, repeat=5):
+    co_df = json_to_df(f'data_{symbol}.json',
+                       path=os.path.join(DATA_DIR, f'data_{symbol}.json'))
+    assert loop_hovertext(co_df) == ohlc_hovertext(co_df)
+    loop_s = min(timeit.repeat(lambda: loop_hovertext(co_df), number=1, repeat=repeat))
+    vec_s = min(timeit.repeat(lambda: ohlc_hovertext(co_df), number=1, repeat=repeat))
+    print(f"{symbol:>6} rows={len(co_df):>5} loop={loop_s * 1e3:8.1f}ms "
+          f"vectorized={vec_s * 1e3:7.1f}ms speedup={loop_s / vec_s:5.1f}x")
+
+
+if __name__ == "__main__":
+    for symbol in sys.argv[1:] or ['aapl', 'msft', 'tsla']:
+        bench(symbol)
@@ -0,0 +1,53 @@
+"""
+Loading every symbol's json_to_df frame, one after the other in process
+vs fanned out over a process pool (stocktools.universe.load_universe),
+from the raw json (a copy of data/data_raw without the store, so every
+load parses) and from the compacted store
+
+    python -m benchmarks.bench_load_universe [max_workers]
+"""
+
+
+import os
+import sys
+import glob
+import shutil
+import tempfile
+import logging
+from stocktools.snapshot import raw_files
+from stocktools.universe import load_universe
+from benchmarks.bench_universe import timed
+
+DATA_DIR = os.path.join(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))), 'data/data_raw')
+
+
+def best_of(fn, repeat=3):
+    return min(timed(fn)[1] for _ in range(repeat))
+
+
+def raw_copy() -> str:
+    # data_raw without its data_store sibling
+    raw_dir = os.path.join(tempfile.mkdtemp(), 'data_raw')
+    os.makedirs(raw_dir)
+    for path in raw_files(DATA_DIR).values():
+        shutil.copy(path, raw_dir)
+    return raw_dir
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    worker_counts = [1] + [n for n in (2, 4, 8, 16, 32) if n <= max_workers]
+    sources = {'json': raw_copy(), 'store': DATA_DIR}
+    n_symbols = len(glob.glob(os.path.join(DATA_DIR, 'data_*.json*')))
+
+    print(f"{n_symbols} symbols, {os.cpu_count()} cpus")
+    for source, data_dir in sources.items():
+        serial = best_of(lambda: load_universe(data_dir=data_dir, workers=1))
+        print(f"{source:5}: in process {serial * 1e3:7.1f}ms")
+        for workers in worker_counts[1:]:
+            seconds = best_of(lambda: load_universe(data_dir=data_dir, workers=workers))
+            print(f"{source:5}: {workers:2d} workers {seconds * 1e3:7.1f}ms "
+                  f"({serial / seconds:4.1f}x)")
+    shutil.rmtree(os.path.dirname(sources['json']))
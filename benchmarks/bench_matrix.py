@@ -0,0 +1,50 @@
+"""
+Cross-sectional reads (every symbol's AdjClose over the last year) from
+the per-symbol files vs the memory mapped price matrix
+(stocktools.price_matrix), in fresh worker processes
+
+    python -m benchmarks.bench_matrix [n_workers]
+"""
+
+
+import os
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from stocktools.price_matrix import build_matrix, is_fresh, matrix_path_for, open_matrix
+from stocktools.snapshot import raw_files
+from stocktools.store import load_bars
+
+DATA_DIR = os.path.join(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))), 'data/data_raw')
+START = '2019-05-20'
+
+
+def from_files(_):
+    start = time.perf_counter()
+    closes = {}
+    for symbol, json_path in raw_files(DATA_DIR).items():
+        bars = load_bars(json_path, ['Date', 'AdjClose'])
+        closes[symbol] = bars['AdjClose'][np.searchsorted(bars['Date'],
+                                                           np.datetime64(START)):]
+    return time.perf_counter() - start
+
+
+def from_matrix(_):
+    start = time.perf_counter()
+    closes = open_matrix(raw_dir=DATA_DIR).field('AdjClose', START)
+    float(np.nansum(closes))  # touch every value
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    n_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    if not is_fresh(matrix_path_for(DATA_DIR), DATA_DIR):
+        build_matrix(DATA_DIR)
+
+    with ProcessPoolExecutor(n_workers) as pool:
+        for name, fn in (('per-symbol files', from_files), ('price matrix', from_matrix)):
+            times = list(pool.map(fn, range(n_workers)))
+            print(f"{name:17}: {np.mean(times) * 1e3:8.2f}ms per worker "
+                  f"({n_workers} workers)")
@@ -0,0 +1,52 @@
+"""
+main_graph payload size and serialization time, the go.Figure built by
+plotting.ohlc_figure vs the typed-array dict of plotting.ohlc_payload
+
+    python -m benchmarks.bench_payload [symbol ...]
+"""
+
+
+import os
+import sys
+import gzip
+import json
+import time
+import plotly.io as pio
+from stocktools.frame_cache import cached_json_to_df
+from stocktools.plotting import ohlc_figure, ohlc_payload, relayout_range
+
+DATA_DIR = os.path.join(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))), 'data/data_raw')
+
+VIEWS = {'all': None,
+         '1y daily': {'xaxis.range[0]': '2019-05-19', 'xaxis.range[1]': '2020-05-19'}}
+
+
+def best_of(fn, repeat=20):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def row(label, text, seconds):
+    body = text.encode()
+    print(f"  {label:8}: {len(body) / 1024:7.1f} KiB "
+          f"({len(gzip.compress(body)) / 1024:6.1f} KiB gzipped) "
+          f"in {seconds * 1e3:6.2f}ms")
+
+
+if __name__ == "__main__":
+    symbols = sys.argv[1:] or ['AAPL', 'TSLA']
+    for symbol in symbols:
+        json_path = os.path.join(DATA_DIR, f'data_{symbol.lower()}.json')
+        co_df = cached_json_to_df(os.path.basename(json_path), path=json_path)
+        for view, relayout_data in VIEWS.items():
+            x_range = relayout_range(relayout_data)
+            print(f"{symbol} {view}")
+            row('figure', *best_of(lambda: pio.to_json(
+                ohlc_figure(symbol, co_df, x_range), validate=False)))
+            row('payload', *best_of(lambda: json.dumps(
+                ohlc_payload(symbol, co_df, x_range))))
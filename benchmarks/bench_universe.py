@@ -0,0 +1,74 @@
+"""
+Indicators for the whole universe, per-symbol pandas loop vs one pass over
+the aligned date x symbol panel (stocktools.universe)
+
+    python -m benchmarks.bench_universe
+"""
+
+
+import os
+import time
+import pandas as pd
+from stocktools.json_to_df import json_to_df
+from stocktools.universe import (available_symbols, load_panel, panel_indicators,
+                                 split_panel)
+
+DATA_DIR = os.path.join(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))), 'data/data_raw')
+
+
+def loop_indicators(co_df):
+    # the same indicator set computed the per-symbol pandas way
+    co_df = co_df.sort_values(by=['Date'])
+    close = co_df['AdjClose']
+    prev_close = close.shift()
+    delta = close.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / 14, min_periods=14, adjust=False).mean()
+    loss = (-delta).clip(lower=0).ewm(alpha=1 / 14, min_periods=14, adjust=False).mean()
+    macd = close.ewm(span=12, min_periods=12, adjust=False).mean() - \
+        close.ewm(span=26, min_periods=26, adjust=False).mean()
+    signal = macd.ewm(span=9, min_periods=9, adjust=False).mean()
+    std = close.rolling(20).std(ddof=0)
+    true_range = pd.concat([co_df['AdjHigh'] - co_df['AdjLow'],
+                            (co_df['AdjHigh'] - prev_close).abs(),
+                            (co_df['AdjLow'] - prev_close).abs()], axis=1).max(axis=1)
+    return pd.DataFrame({
+        'SMA_20day': close.rolling(20).mean(),
+        'EMA_20day': close.ewm(span=20, min_periods=20, adjust=False).mean(),
+        'MACD': macd,
+        'MACD_signal': signal,
+        'MACD_hist': macd - signal,
+        'RSI_14day': 100 - 100 / (1 + gain / loss),
+        'BB_lower': close.rolling(20).mean() - 2 * std,
+        'BB_upper': close.rolling(20).mean() + 2 * std,
+        'ATR_14day': true_range.ewm(alpha=1 / 14, min_periods=14, adjust=False).mean(),
+        '52WkHigh': co_df['AdjHigh'].rolling(252, min_periods=1).max(),
+        '52WkLow': co_df['AdjLow'].rolling(252, min_periods=1).min()})
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    symbols = available_symbols(DATA_DIR)
+
+    frames, loop_load_s = timed(lambda: {
+        symbol: json_to_df(f'data_{symbol}.json',
+                           path=os.path.join(DATA_DIR, f'data_{symbol}.json'))
+        for symbol in symbols})
+    _, loop_calc_s = timed(lambda: {symbol: loop_indicators(co_df)
+                                    for symbol, co_df in frames.items()})
+
+    panel, panel_load_s = timed(load_panel, symbols, DATA_DIR)
+    columns, panel_calc_s = timed(panel_indicators, panel)
+    _, split_s = timed(split_panel, panel, columns)
+
+    print(f"{len(symbols)} symbols, {len(panel.dates)} trading days")
+    print(f"per-symbol loop: load {loop_load_s * 1e3:7.1f}ms "
+          f"indicators {loop_calc_s * 1e3:7.1f}ms")
+    print(f"panel          : load {panel_load_s * 1e3:7.1f}ms "
+          f"indicators {panel_calc_s * 1e3:7.1f}ms split {split_s * 1e3:6.1f}ms")
+    print(f"indicator speedup {loop_calc_s / panel_calc_s:5.1f}x")
@@ -0,0 +1,36 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+# gunicorn -c gunicorn.conf.py wsgi:server
+#
+# Every setting can be overridden from the environment, e.g.
+#     WEB_CONCURRENCY=8 PORT=8080 gunicorn -c gunicorn.conf.py wsgi:server
+
+import os
+import multiprocessing
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '8050')}"
+
+# callbacks are mostly cpu bound (pandas, json), so processes for
+# throughput and a few threads each to overlap the file reads
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# wsgi.py loads the frames and warms the figure cache once in the master,
+# the workers are forked with them already in memory
+preload_app = True
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# recycles workers now and then, the frame cache is bounded but pandas
+# fragments the heap over time
+max_requests = 10000
+max_requests_jitter = 1000
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', None)
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
@@ -0,0 +1,198 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from stocktools.snapshot import raw_files
+from stocktools.store import load_bars
+
+# Split and dividend adjustment computed from a symbol's unadjusted bars and
+# its event stream (the DivAmount and SplitRatio columns of the store), so
+# AdjClose can be kept current without refetching the full history.
+#
+# An event on day t scales every bar before t by
+#     m[t] = (1 - DivAmount[t] / Close[t - 1]) / SplitRatio[t]
+# (m = 1 on days without one) and a day's adjustment factor is the product
+# of the multipliers after it, a reverse cumprod:
+#     F[i] = m[i + 1] * ... * m[n - 1]        AdjClose = Close * F
+#
+# Adjustments keeps the forward cumprod G[i] = m[0] * ... * m[i] instead,
+# F[i] = G[n - 1] / G[i]: new bars only extend G, and an event reported late
+# for a stored day only rescales G from that day on, so the stored part
+# never has to be recomputed. Every older factor changes by the same scale,
+# which is what a stored AdjClose is multiplied by (see scale_since).
+#
+# With ordinary dividends and splits a full recompute is within ~0.1% of
+# alpha vantage's adjusted close (it rounds along the way). Spin-offs it
+# books as a cash dividend (ford 2000, googl 2014, abbott 2013) are adjusted
+# the vendor's own way, so the days before them differ by up to a few %:
+#
+#     python -m stocktools.adjust data/data_raw    # agreement per symbol
+
+
+def event_multipliers(close, dividends, splits, previous_close: float = np.nan):
+    # m[t] for each bar, previous_close is the close of the bar before
+    # close[0] when there is one
+    close = np.asarray(close, dtype='float64')
+    prior = np.concatenate([[previous_close], close[:-1]])
+    splits = np.asarray(splits, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # no prior close to express the dividend against, only the split
+        cash = np.where(prior > 0, 1.0 - np.asarray(dividends) / prior, 1.0)
+        return cash / np.where(splits > 0, splits, 1.0)
+
+
+def adjustment_factors(bars: dict) -> np.ndarray:
+    # F for every bar of ascending bars in one pass
+    multipliers = event_multipliers(bars['Close'], bars['DivAmount'], bars['SplitRatio'])
+    factors = np.ones_like(multipliers)
+    factors[:-1] = np.cumprod(multipliers[:0:-1])[::-1]
+    return factors
+
+
+def adjusted_close(bars: dict) -> np.ndarray:
+    return bars['Close'] * adjustment_factors(bars)
+
+
+def events(bars: dict) -> dict:
+    # the event stream: the days with a dividend or a split
+    mask = (bars['DivAmount'] != 0.0) | (bars['SplitRatio'] != 1.0)
+    return {name: bars[name][mask] for name in ('Date', 'DivAmount', 'SplitRatio')}
+
+
+class Adjustments(object):
+    """
+    Adjustment factors of one symbol's ascending bars, kept current as bars
+    and events arrive:
+
+        adjustments = Adjustments(load_bars(json_path))
+        adjustments.adjust(bars['Close'])       # AdjClose
+        scale = adjustments.append(new_bars)    # older factors times scale
+    """
+
+    def __init__(self, bars: dict):
+        self._size = 0
+        self._dates = np.empty(0, dtype='datetime64[D]')
+        self._close = np.empty(0)
+        self._dividends = np.empty(0)
+        self._splits = np.empty(0)
+        self._multipliers = np.empty(0)
+        self._growth = np.empty(0)
+        self.append(bars)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self._dates[:self._size]
+
+    def factors(self) -> np.ndarray:
+        growth = self._growth[:self._size]
+        return growth[-1] / growth if self._size else growth.copy()
+
+    def adjust(self, values) -> np.ndarray:
+        # Close (or Open, High, Low) of the same bars, adjusted
+        return np.asarray(values, dtype='float64') * self.factors()
+
+    def events(self) -> dict:
+        return events({'Date': self.dates, 'DivAmount': self._dividends[:self._size],
+                       'SplitRatio': self._splits[:self._size]})
+
+    def append(self, bars: dict) -> float:
+        """
+        Adds bars dated after the last one, returns what the factors of the
+        bars already here were multiplied by (1.0 unless the new bars carry
+        an event).
+        """
+        dates = np.asarray(bars['Date']).astype('datetime64[D]')
+        if not len(dates):
+            return 1.0
+        if self._size and dates[0] <= self._dates[self._size - 1]:
+            raise ValueError(f'bars from {dates[0]} are not after the last one, '
+                             f'{self._dates[self._size - 1]}')
+        previous_close = self._close[self._size - 1] if self._size else np.nan
+        multipliers = event_multipliers(bars['Close'], bars['DivAmount'], bars['SplitRatio'],
+                                        previous_close)
+        start = self._size
+        self._reserve(start + len(dates))
+        self._dates[start:start + len(dates)] = dates
+        self._close[start:start + len(dates)] = bars['Close']
+        self._dividends[start:start + len(dates)] = bars['DivAmount']
+        self._splits[start:start + len(dates)] = bars['SplitRatio']
+        self._multipliers[start:start + len(dates)] = multipliers
+        growth = self._growth[start:start + len(dates)]
+        np.cumprod(multipliers, out=growth)
+        if start:
+            growth *= self._growth[start - 1]
+        self._size += len(dates)
+        return self.scale_since(dates[0])
+
+    def revise(self, date, dividend: float = 0.0, split: float = 1.0) -> float:
+        """
+        Sets the event of a stored day (one reported late, or corrected),
+        returns what the factors of the days before it were multiplied by.
+        """
+        i = self._index(date)
+        self._dividends[i] = dividend
+        self._splits[i] = split
+        previous_close = self._close[i - 1] if i else np.nan
+        multiplier = event_multipliers(self._close[i:i + 1], [dividend], [split],
+                                       previous_close)[0]
+        scale = multiplier / self._multipliers[i]
+        self._multipliers[i] = multiplier
+        # F of the days from i on is unchanged, G[-1] and G[j] scale alike
+        self._growth[i:self._size] *= scale
+        return scale
+
+    def scale_since(self, date) -> float:
+        # product of the multipliers from `date` on: how much the events
+        # since then moved the factors of every earlier day
+        i = self._index(date)
+        if i == 0:
+            return 1.0
+        return self._growth[self._size - 1] / self._growth[i - 1]
+
+    def _index(self, date) -> int:
+        date = np.datetime64(date, 'D')
+        i = int(np.searchsorted(self.dates, date))
+        if i == self._size or self._dates[i] != date:
+            raise KeyError(str(date))
+        return i
+
+    def _reserve(self, size: int):
+        # capacity doubles, appending a day at a time doesn't copy the history
+        if size <= len(self._growth):
+            return
+        capacity = max(size, 2 * len(self._growth))
+        for name in ('_dates', '_close', '_dividends', '_splits', '_multipliers', '_growth'):
+            values = getattr(self, name)
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:self._size] = values[:self._size]
+            setattr(self, name, grown)
+
+
+def agreement_report(data_dir: str = '../data/data_raw/') -> pd.DataFrame:
+    # recomputed AdjClose against the stored one, per symbol
+    rows = []
+    for symbol in raw_files(data_dir):
+        bars = load_bars(os.path.join(data_dir, f'data_{symbol}.json'))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            error = np.abs(adjusted_close(bars) / bars['AdjClose'] - 1.0)
+        rows.append({'symbol': symbol, 'days': len(bars['Date']),
+                     'events': len(events(bars)['Date']),
+                     'median_error': np.nanmedian(error) if len(error) else np.nan,
+                     'max_error': np.nanmax(error) if len(error) else np.nan})
+    return pd.DataFrame(rows).set_index('symbol')
+
+
+if __name__ == "__main__":
+    # python -m stocktools.adjust data/data_raw
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else '../data/data_raw/'
+    report = agreement_report(data_dir)
+    print(report.to_string(float_format='{:.2e}'.format))
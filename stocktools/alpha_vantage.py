@@ -6,12 +6,13 @@ Copyright (c) 2020 - Sergio Chairez
 
 
 import os
-import json
 import logging
 import aiohttp
 import asyncio
 import sys
 from collections import namedtuple
+from stocktools.rate_limit import RateLimiter, state_path_for
+from stocktools.snapshot import write_snapshot
 
 logging.basicConfig(
     level=logging.INFO,
@@ -27,11 +28,11 @@ class FetchAlphaVantage(object):
         "TIME_SERIES_DAILY_ADJUSTED&symbol="
     _API_URL_FOREX_WEEKLY = _BASE_API_URL + "FX_WEEKLY"
 
-    _RATE_LIMIT = 5
 
     def __init__(self, api_key=None,
                  symbols: list = [],
-                 out_path='../data/data_raw/'):
+                 out_path='../data/data_raw/',
+                 rate_limiter: RateLimiter = None):
 
         if api_key is None:
             api_key = os.environ.get('ALPHA_VANTAGE_API_KEY')
@@ -51,31 +52,30 @@ class FetchAlphaVantage(object):
 
         self._loop = asyncio.get_event_loop()
         self._loop.set_debug(True)
-        self._sema = asyncio.Semaphore(FetchAlphaVantage._RATE_LIMIT)
+        # API call frequency is 5 calls per minute and 500 calls per day
+        self._rate_limiter = rate_limiter or RateLimiter(
+            state_path=state_path_for(out_path))
         self._loop.run_until_complete(self._fetch_all())
 
     async def _fetch_all(self):
-        # API call frequency is 5 calls per minute and
-        # 500 calls per day, so we need to rate limit our requests :/
         async with aiohttp.ClientSession(loop=self._loop) as session:
             await asyncio.gather(*[self._fetch(session, stock_meta.symbol, stock_meta.url) for stock_meta in self._stocks_meta],
                                  return_exceptions=True)
 
     async def _fetch(self, session, symbol, url):
-        async with self._sema, session.get(url) as response:
+        await self._rate_limiter.acquire()
+        async with session.get(url) as response:
             response.raise_for_status()
             log.info(
                 "Got response [%s] for URL: %s with symbol: %s", response.status, url, symbol)
             data = await response.json()
             # print(data)
             FetchAlphaVantage._write_json_file(self._out_path, symbol, data)
-            await asyncio.sleep(60)
-            # 5 calls per minute are permitted by this API
 
     @staticmethod
     def _write_json_file(out_path, symbol, data):
-        with open(f'../data/data_raw/data_{symbol}.json', "w") as write_json:
-            json.dump(data, write_json, indent=2, sort_keys=False)
+        # compact gzipped json, see stocktools/snapshot.py
+        write_snapshot(os.path.join(out_path, f'data_{symbol}.json'), data)
 
         log.info("Wrote results for symbol: %s", symbol)
 
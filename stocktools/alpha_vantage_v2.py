@@ -6,12 +6,16 @@ Copyright (c) 2020 - Sergio Chairez
 
 
 import os
-import json
 import logging
-import aiohttp
 import asyncio
 import sys
-from collections import namedtuple
+from stocktools.adjust import Adjustments
+from stocktools.incremental import (merge_time_series, needs_full_history, new_bars,
+                                    read_stored_response, rescale_adjusted_close)
+from stocktools.rate_limit import RateLimiter, state_path_for
+from stocktools.snapshot import write_snapshot
+from stocktools.store import bars_from_response, store_path_for, write_store
+from stocktools.client import AlphaVantageClient, FetchResult
 
 logging.basicConfig(
     level=logging.INFO,
@@ -36,12 +40,13 @@ class FetchAlphaVantage(object):
     _API_URL_FOREX_DAILY = _BASE_API_URL + "FX_DAILY"
     _API_URL_FOREX_WEEKLY = _BASE_API_URL + "FX_WEEKLY"
 
-    _RATE_LIMIT = 5
 
     def __init__(self, api_key=None, data_feed_type: str = "time_series_weekly_adjusted",
                  symbols=None, symbol=None, from_symbol=None, to_symbol=None,
                  from_currency=None, to_currency=None,
-                 out_path='../data/data_raw/'):
+                 out_path='../data/data_raw/', incremental: bool = False,
+                 rate_limiter: RateLimiter = None, client: AlphaVantageClient = None,
+                 base_url: str = None, on_fetched=None, run: bool = True):
 
         if api_key is None:
             api_key = os.environ.get('ALPHA_VANTAGE_API_KEY')
@@ -49,7 +54,15 @@ class FetchAlphaVantage(object):
             raise ValueError(
                 'you need to provide a valid Alpha Vantage API key')
 
+        self._api_key = api_key
+        # None means ALPHA_VANTAGE_BASE_URL or the real api, see AlphaVantageClient
+        self._base_url = base_url
         self._data_feed_type = data_feed_type
+        # API call frequency is 5 calls per minute and 500 calls per day,
+        # the limiter's state is kept next to the data so back to back runs
+        # share the same budget
+        self._rate_limiter = rate_limiter or RateLimiter(
+            state_path=state_path_for(out_path))
 
         time_series: list = ["time_series_intraday", "time_series_daily",
                              "time_series_daily_adjusted", "time_series_weekly", "time_series_weekly_adjusted"]
@@ -63,8 +76,6 @@ class FetchAlphaVantage(object):
             if self._symbol is None:
                 raise AttributeError(
                     "NoneType in symbol arg not allowed when data_feed_type is quote_endpoint")
-            self._url = FetchAlphaVantage._get_quote_url(
-                self._symbol) + f"&apikey={api_key}"
 
         elif self._data_feed_type == "currency_exchange_rate":
             self._from_currency = from_currency
@@ -72,8 +83,6 @@ class FetchAlphaVantage(object):
             if any(elem is None for elem in [self._from_currency, self._to_currency]):
                 raise AttributeError(
                     "NoneType in from_currency or to_currency")
-            self._url = FetchAlphaVantage._get_currency_exchange_rate_url(
-                self._from_currency, self._to_currency) + f"&apikey={api_key}"
 
         elif self._data_feed_type in fx:
             self._from_symbol = from_symbol
@@ -88,38 +97,99 @@ class FetchAlphaVantage(object):
             if not self._symbols:
                 raise ValueError("symbols arg is an empty sequence")
             self._out_path = out_path
-            StockInfo: tuple = namedtuple('Stock', ['symbol', 'url'])
-            self._stocks_meta: list = [
-                StockInfo(symbol,
-                          FetchAlphaVantage._API_URL_TIME_SERIES_DAILY_ADJ + symbol +
-                          "&outputsize=full" + f"&apikey={api_key}")
-                for symbol in self._symbols
-            ]
-            self._loop = asyncio.get_event_loop()
-            self._loop.set_debug(True)
-            self._sema = asyncio.Semaphore(FetchAlphaVantage._RATE_LIMIT)
-            self._loop.run_until_complete(self._fetch_all_historical())
+            # incremental: fetch only the latest 100 bars (outputsize=compact)
+            # for symbols we already have and merge them into the stored file
+            self._incremental = incremental
+            # a shared client is left open for its owner, otherwise one is
+            # opened for this run only
+            self._client = client
+            # e.g. FigureCache(out_path).warm, called with the symbols whose
+            # data was updated so caches built on it can catch up
+            self._on_fetched = on_fetched
+            self.results: list = []
+            # run=False leaves it to the caller to await refresh() on its
+            # own loop (see stocktools/scheduler.py)
+            if run:
+                self._loop = asyncio.get_event_loop()
+                self._loop.set_debug(True)
+                self._loop.run_until_complete(self.refresh())
 
         # elif data_feed_type in ["currency_exchange_rate"]:
         #     pass
 
+    async def refresh(self) -> list:
+        self.results = await self._fetch_all_historical()
+        if self._on_fetched is not None:
+            self._on_fetched([result.symbol for result in self.results
+                              if result.error is None])
+        return self.results
+
     async def _fetch_all_historical(self):
-        # API call frequency is 5 calls per minute and
-        # 500 calls per day, so we need to rate limit our requests :/
-        async with aiohttp.ClientSession(loop=self._loop) as session:
-            await asyncio.gather(*[self._fetch_historical(session, stock_meta.symbol, stock_meta.url) for stock_meta in self._stocks_meta],
-                                 return_exceptions=True)
-
-    async def _fetch_historical(self, session, symbol, url):
-        async with self._sema, session.get(url) as response:
-            response.raise_for_status()
-            log.info(
-                "Got response [%s] for URL: %s with symbol: %s", response.status, url, symbol)
-            data = await response.json()
-            # print(data)
-            FetchAlphaVantage._write_json_file(self._out_path, symbol, data)
-            # 5 calls per minute are permitted by this API
-            await asyncio.sleep(60)
+        # one FetchResult per symbol with the bars it now has stored,
+        # failures are logged by the client
+        if self._client is not None:
+            return await self._fetch_with(self._client)
+        async with self._make_client() as client:
+            return await self._fetch_with(client)
+
+    async def _fetch_with(self, client):
+        fetch = self._fetch_incremental if self._incremental else self._fetch_historical
+        return await asyncio.gather(*[self._fetch_symbol(fetch, client, symbol)
+                                      for symbol in self._symbols])
+
+    @staticmethod
+    async def _fetch_symbol(fetch, client, symbol):
+        # network failures come back as results from the client, anything
+        # else raised for one symbol (a file that can't be written, ...)
+        # becomes its result too instead of cancelling the whole run
+        try:
+            return await fetch(client, symbol)
+        except Exception as e:
+            log.exception("Failed to refresh symbol: %s", symbol)
+            return FetchResult(symbol, None, f"{type(e).__name__}: {e}", 0)
+
+    async def _fetch_historical(self, client, symbol):
+        # the response is decoded into bars while it is saved as a snapshot,
+        # columnar store copy is written from those bars right after
+        json_path = os.path.join(self._out_path, f'data_{symbol}.json')
+        result = await client.time_series_bars(symbol, "full", raw_path=json_path)
+        if result.error is None:
+            write_store(result.data, store_path_for(json_path))
+            log.info("Wrote results for symbol: %s", symbol)
+        return result
+
+    async def _fetch_incremental(self, client, symbol):
+        json_path = os.path.join(self._out_path, f'data_{symbol}.json')
+        try:
+            stored = read_stored_response(json_path)
+        except (OSError, EOFError, ValueError) as e:
+            # a corrupt snapshot is replaced by a full fetch
+            log.warning("Unreadable stored data for %s, refetching: %s", symbol, e)
+            stored = None
+        if stored is not None:
+            result = await client.time_series_daily_adjusted(symbol, "compact")
+            if result.error is not None:
+                return result
+            if not needs_full_history(stored, result.data):
+                added = new_bars(stored, result.data)
+                merged = merge_time_series(stored, result.data)
+                bars = bars_from_response(merged)
+                if added:
+                    # a split or dividend among the new bars moves the adjusted
+                    # close of every stored day older than the compact window
+                    scale = Adjustments(bars).scale_since(min(added))
+                    if scale != 1.0:
+                        window_start = min(result.data['Time Series (Daily)'])
+                        merged = rescale_adjusted_close(merged, window_start, scale)
+                        bars = bars_from_response(merged)
+                        log.info("Adjusted stored history of %s by %.6f", symbol, scale)
+                    FetchAlphaVantage._write_json_file(self._out_path, symbol, merged)
+                    write_store(bars, store_path_for(json_path))
+                log.info("Merged %d new bars for symbol: %s", len(added), symbol)
+                # same shape as a full fetch's result
+                return result._replace(data=bars)
+            log.info("Refetching full history for symbol: %s", symbol)
+        return await self._fetch_historical(client, symbol)
 
     def fetch_quote(self):
         loop = asyncio.get_event_loop()
@@ -128,11 +198,21 @@ class FetchAlphaVantage(object):
         return data
 
     async def _fetch_quote(self, loop):
-        async with aiohttp.ClientSession(loop=loop) as client:
-            async with client.get(self._url) as response:
-                assert response.status == 200
-                data = await response.json()
-                return data
+        # quote, exchange rate and fx feeds, None if the call failed
+        async with self._make_client() as client:
+            if self._data_feed_type == "quote_endpoint":
+                result = await client.quote(self._symbol)
+            elif self._data_feed_type == "currency_exchange_rate":
+                result = await client.currency_exchange_rate(
+                    self._from_currency, self._to_currency)
+            else:
+                result = await client.fx(self._data_feed_type,
+                                         self._from_symbol, self._to_symbol)
+        return result.data
+
+    def _make_client(self):
+        return AlphaVantageClient(self._api_key, base_url=self._base_url,
+                                  rate_limiter=self._rate_limiter)
 
     @classmethod
     def _get_fx_rate_url(cls, fn_param, from_symbol, to_symbol):
@@ -160,8 +240,8 @@ class FetchAlphaVantage(object):
 
     @staticmethod
     def _write_json_file(out_path, symbol, data):
-        with open(f'../data/data_raw/data_{symbol}.json', "w") as write_json:
-            json.dump(data, write_json, indent=2, sort_keys=False)
+        # compact gzipped json, see stocktools/snapshot.py
+        write_snapshot(os.path.join(out_path, f'data_{symbol}.json'), data)
 
         log.info("Wrote results for symbol: %s", symbol)
 
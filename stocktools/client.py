@@ -0,0 +1,210 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import json
+import random
+import asyncio
+import logging
+from collections import namedtuple
+import aiohttp
+from stocktools.rate_limit import RateLimiter
+from stocktools.json_stream import CHUNK_SIZE, decode_chunks
+from stocktools.snapshot import FAST_LEVEL, SnapshotWriter
+
+log = logging
+
+# one result per requested symbol instead of exceptions lost in a gather():
+# data is the decoded response on success, error a short description otherwise
+FetchResult = namedtuple('FetchResult', ['symbol', 'data', 'error', 'attempts'])
+
+
+class ThrottledError(Exception):
+    # alpha vantage answers over-quota calls with a 200 and a "Note" payload
+    pass
+
+
+class AlphaVantageClient(object):
+    """
+    Long lived async client for the Alpha Vantage API. One instance owns a
+    pooled keep-alive connection and is meant to be shared by every job in
+    a process:
+
+        async with AlphaVantageClient() as client:
+            results = await client.fetch_many(['aapl', 'msft'])
+
+    Calls go through the rate limiter, time out after `timeout` seconds and
+    are retried with exponential backoff on connection errors, 5xx responses,
+    throttle payloads and bodies that don't decode.
+    """
+
+    _BASE_API_URL = "https://www.alphavantage.co/query"
+
+    def __init__(self, api_key=None, base_url: str = None,
+                 rate_limiter: RateLimiter = None, max_connections: int = 10,
+                 timeout: float = 30.0, max_retries: int = 4, backoff: float = 2.0):
+        if api_key is None:
+            api_key = os.environ.get('ALPHA_VANTAGE_API_KEY')
+        if not api_key or not isinstance(api_key, str):
+            raise ValueError(
+                'you need to provide a valid Alpha Vantage API key')
+        self._api_key = api_key
+        # ALPHA_VANTAGE_BASE_URL points every client at a stand-in server
+        # (see stocktools/fake_server.py)
+        self._base_url = base_url or os.environ.get(
+            'ALPHA_VANTAGE_BASE_URL', AlphaVantageClient._BASE_API_URL)
+        self._rate_limiter = rate_limiter or RateLimiter()
+        self._max_connections = max_connections
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._session = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+        return False
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._max_connections,
+                                             keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=self._timeout)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, params: dict, read=None) -> tuple:
+        # (decoded json, attempts), raises once the retries are used up;
+        # read(response) replaces the json decode of the body
+        await self.start()
+        params = dict(params, apikey=self._api_key)
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._rate_limiter.acquire()
+            try:
+                return await self._get(params, read), attempt
+            except (aiohttp.ClientError, asyncio.TimeoutError, ThrottledError, ValueError) as e:
+                if not AlphaVantageClient._retryable(e) or attempt > self._max_retries:
+                    e.attempts = attempt
+                    raise
+                delay = self._backoff * 2 ** (attempt - 1) * (1 + random.random() / 2)
+                log.warning("Retrying %s %s in %.1fs after: %s",
+                            params.get('function'), params.get('symbol', ''), delay,
+                            AlphaVantageClient._describe(e))
+                await asyncio.sleep(delay)
+
+    async def fetch(self, symbol: str, params: dict, read=None) -> FetchResult:
+        try:
+            data, attempts = await self.request(params, read)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ThrottledError, ValueError) as e:
+            error = AlphaVantageClient._describe(e)
+            log.error("Failed to fetch %s: %s", symbol, error)
+            return FetchResult(symbol, None, error, getattr(e, 'attempts', 1))
+        return FetchResult(symbol, data, None, attempts)
+
+    async def time_series_daily_adjusted(self, symbol: str,
+                                         outputsize: str = "full") -> FetchResult:
+        return await self.fetch(symbol, {'function': 'TIME_SERIES_DAILY_ADJUSTED',
+                                         'symbol': symbol,
+                                         'outputsize': outputsize})
+
+    async def fetch_many(self, symbols: list, outputsize: str = "full") -> list:
+        return await asyncio.gather(*[self.time_series_daily_adjusted(symbol, outputsize)
+                                      for symbol in symbols])
+
+    async def time_series_bars(self, symbol: str, outputsize: str = "full",
+                               raw_path: str = None) -> FetchResult:
+        # time_series_daily_adjusted decoded as it streams in, data is the
+        # bars dict (see stocktools/json_stream.py) rather than the nested
+        # json; the response is saved as a snapshot of raw_path on the way
+        # through (see stocktools/snapshot.py)
+        async def read(response):
+            chunks = response.content.iter_chunked(CHUNK_SIZE)
+            if raw_path is None:
+                return AlphaVantageClient._bars(
+                    await decode_chunks(chunks, response.content_length))
+            # a body cut short raises json.JSONDecodeError from the decoder's
+            # close(), retried like the json path; only a complete time
+            # series replaces the saved snapshot
+            with SnapshotWriter(raw_path, FAST_LEVEL) as sink:
+                return AlphaVantageClient._bars(
+                    await decode_chunks(chunks, response.content_length, sink))
+
+        return await self.fetch(symbol, {'function': 'TIME_SERIES_DAILY_ADJUSTED',
+                                         'symbol': symbol,
+                                         'outputsize': outputsize}, read)
+
+    async def quote(self, symbol: str) -> FetchResult:
+        return await self.fetch(symbol, {'function': 'GLOBAL_QUOTE', 'symbol': symbol})
+
+    async def currency_exchange_rate(self, from_currency: str,
+                                     to_currency: str) -> FetchResult:
+        return await self.fetch(f'{from_currency}/{to_currency}',
+                                {'function': 'CURRENCY_EXCHANGE_RATE',
+                                 'from_currency': from_currency,
+                                 'to_currency': to_currency})
+
+    async def fx(self, function: str, from_symbol: str, to_symbol: str) -> FetchResult:
+        # function is one of FX_DAILY, FX_WEEKLY, FX_MONTHLY
+        return await self.fetch(f'{from_symbol}/{to_symbol}',
+                                {'function': function.upper(),
+                                 'from_symbol': from_symbol,
+                                 'to_symbol': to_symbol})
+
+    async def _get(self, params: dict, read=None) -> dict:
+        async with self._session.get(self._base_url, params=params) as response:
+            response.raise_for_status()
+            log.info("Got response [%s] for %s %s", response.status,
+                     params.get('function'), params.get('symbol', ''))
+            if read is not None:
+                return await read(response)
+            data = await response.json(content_type=None)
+        AlphaVantageClient._check(data)
+        return data
+
+    @staticmethod
+    def _check(data):
+        if isinstance(data, dict):
+            note = data.get('Note') or data.get('Information')
+            if note and 'call frequency' in note:
+                raise ThrottledError(note)
+            if 'Error Message' in data:
+                raise ValueError(data['Error Message'])
+
+    @staticmethod
+    def _bars(decoder) -> dict:
+        bars = decoder.close()
+        if bars is None:
+            AlphaVantageClient._check(decoder.payload())
+            raise ValueError('no "Time Series (Daily)" in the response')
+        return bars
+
+    @staticmethod
+    def _describe(e) -> str:
+        # short and without the request url, which carries the api key
+        if isinstance(e, aiohttp.ClientResponseError):
+            return f"HTTP {e.status} {e.message}"
+        return f"{type(e).__name__}: {e}"
+
+    @staticmethod
+    def _retryable(e) -> bool:
+        if isinstance(e, json.JSONDecodeError):
+            # a truncated or partial body, fetching again usually gets it whole
+            return True
+        if isinstance(e, ValueError):
+            # "Error Message" payloads (unknown symbol, bad params)
+            return False
+        if isinstance(e, aiohttp.ClientResponseError):
+            return e.status >= 500 or e.status == 429
+        return True
@@ -0,0 +1,150 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from stocktools.indicators import ema, sma
+from stocktools.json_to_df import DERIVED, INDICATORS, json_to_df
+from stocktools.snapshot import raw_files
+from stocktools.store import load_bars
+
+# Opt-in compact in-memory form of a symbol's bars, for caches that hold
+# the whole universe in every worker (see frame_cache, which uses it when
+# STOCKTOOLS_COMPACT_FRAMES=1):
+#   prices        float32 instead of float64
+#   Volume        the narrowest unsigned int its maximum fits in
+#   Date          int32 days since 1970-01-01
+#   derived       (DERIVED in json_to_df) computed on first access and kept,
+#                 to_df() keeps the indicators too and builds the cheap
+#                 price columns nobody asked for without keeping them
+#
+#     python -m stocktools.compact data/data_raw    # memory per symbol
+
+
+class CompactFrame(object):
+    """
+    Column access by name like a frame, ascending date order, numpy arrays:
+
+        frame = load_compact('data_aapl.json', path=...)
+        frame['AdjHigh']    # computed now, kept from here on
+        frame.to_df()       # json_to_df's frame (newest first, float32)
+    """
+
+    def __init__(self, bars: dict):
+        dates = np.asarray(bars['Date']).astype('datetime64[D]')
+        self.days = dates.astype('int64').astype('int32')
+        self._stored = {}
+        for name, values in bars.items():
+            if name == 'Date':
+                continue
+            if name == 'Volume':
+                top = int(values.max()) if len(values) else 0
+                self._stored[name] = values.astype(np.min_scalar_type(max(top, 0)))
+            else:
+                self._stored[name] = values.astype('float32')
+        self._derived = {}
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    @property
+    def columns(self) -> list:
+        return ['Date'] + list(self._stored) + [name for name in DERIVED
+                                                if self._can_derive(name)]
+
+    @property
+    def nbytes(self) -> int:
+        return self.days.nbytes + sum(values.nbytes for values in self._stored.values()) + \
+            sum(values.nbytes for values in self._derived.values())
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name == 'Date':
+            return self.days.astype('datetime64[D]')
+        if name in self._stored:
+            return self._stored[name]
+        if name not in self._derived:
+            self._derived[name] = self._derive(name)
+        return self._derived[name]
+
+    def drop_derived(self):
+        self._derived.clear()
+
+    def to_df(self, columns=None) -> pd.DataFrame:
+        columns = self.columns if columns is None else columns
+        data = {}
+        for name in columns:
+            if name == 'Date' or name in self._stored or name in self._derived or \
+                    name in INDICATORS:
+                # the indicators are most of the cost of a frame, they are
+                # kept once built so a cache hit doesn't recompute them
+                values = self[name]
+            else:
+                values = self._derive(name)
+            data[name] = values[::-1]
+        if 'Date' in data:
+            # seconds like json_to_df's frame, pd.to_datetime walks a day-unit
+            # column value by value
+            data['Date'] = data['Date'].astype('datetime64[s]')
+        return pd.DataFrame(data)
+
+    def _can_derive(self, name: str) -> bool:
+        return all(source in self._stored for source in DERIVED[name])
+
+    def _derive(self, name: str) -> np.ndarray:
+        if name not in DERIVED or not self._can_derive(name):
+            raise KeyError(name)
+        if name == 'AdjFactor':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return self['AdjClose'] / self['Close']
+        if name in ('AdjOpen', 'AdjHigh', 'AdjLow'):
+            factor = self._derived.get('AdjFactor')
+            if factor is None:
+                factor = self._derive('AdjFactor')
+            return self[name[len('Adj'):]] * factor
+        if name == 'SMA_20day':
+            return sma(self['AdjClose'], 20).astype('float32')
+        return ema(self['AdjClose'], span=20).astype('float32')
+
+
+def load_compact(file_name: str, path=None) -> CompactFrame:
+    # same arguments as json_to_df
+    path_to_file = f'../data/data_raw/{file_name}' if path is None else path
+    return CompactFrame(load_bars(path_to_file))
+
+
+def memory_report(data_dir: str = '../data/data_raw/') -> pd.DataFrame:
+    # bytes per symbol: json_to_df's frame, the compact form as loaded and
+    # once every derived column has been asked for
+    rows = []
+    for symbol in raw_files(data_dir):
+        json_path = os.path.join(data_dir, f'data_{symbol}.json')
+        df = json_to_df(os.path.basename(json_path), path=json_path)
+        compact = CompactFrame(load_bars(json_path))
+        loaded = compact.nbytes
+        for name in DERIVED:
+            compact[name]
+        rows.append({'symbol': symbol, 'days': len(df),
+                     'frame': int(df.memory_usage(index=True, deep=True).sum()),
+                     'compact': loaded, 'compact_derived': compact.nbytes})
+    return pd.DataFrame(rows).set_index('symbol')
+
+
+if __name__ == "__main__":
+    # python -m stocktools.compact data/data_raw
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else '../data/data_raw/'
+    report = memory_report(data_dir)
+    kib = report[['frame', 'compact', 'compact_derived']] / 1024
+    print(pd.concat([report[['days']], kib.round(1)], axis=1).to_string())
+    total = kib.sum()
+    print(f"\n{len(report)} symbols: frames {total['frame'] / 1024:.1f} MiB, "
+          f"compact {total['compact'] / 1024:.1f} MiB "
+          f"({total['frame'] / total['compact']:.1f}x smaller), "
+          f"{total['compact_derived'] / 1024:.1f} MiB with every derived column")
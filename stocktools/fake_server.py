@@ -0,0 +1,261 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import asyncio
+import argparse
+import logging
+from collections import deque
+from functools import lru_cache
+import numpy as np
+from aiohttp import web
+from stocktools.snapshot import read_snapshot, resolve
+
+# library module, the CLI below configures logging
+log = logging.getLogger(__name__)
+
+# Local stand-in for the Alpha Vantage /query endpoint, for load testing
+# the fetch pipeline offline. Symbols with a data_<sym>.json[.gz] in data_dir are
+# served from it, any other symbol gets a deterministic synthetic history.
+# Point the fetchers at it with base_url / ALPHA_VANTAGE_BASE_URL:
+#
+#     python -m stocktools.fake_server --port 8765 --latency 0.05 --error-rate 0.01
+#     ALPHA_VANTAGE_BASE_URL=http://127.0.0.1:8765/query python ...
+
+_LAST_DAY = np.datetime64('2020-05-19')
+# synthetic symbols share this many pre-rendered histories so the server
+# stays cheap next to the client it is load testing
+_SYNTHETIC_POOL = 16
+_SYMBOL_PLACEHOLDER = '__SYMBOL__'
+_THROTTLE_NOTE = ("Thank you for using Alpha Vantage! Our standard API call frequency "
+                  "is 5 calls per minute and 500 calls per day.")
+
+
+def _seed(*names) -> int:
+    return zlib.crc32('/'.join(names).lower().encode())
+
+
+def _business_days(n_days: int) -> list:
+    days = np.busday_offset(_LAST_DAY, -np.arange(n_days), roll='backward')
+    return [str(day) for day in days]
+
+
+@lru_cache(maxsize=64)
+def synthetic_time_series(symbol: str, n_days: int = 5000) -> dict:
+    # geometric random walk, newest day first like the real api
+    rng = np.random.default_rng(_seed(symbol))
+    close = 20.0 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n_days)))[::-1]
+    spread = close * rng.uniform(0.0, 0.02, n_days)
+    open_ = close + rng.uniform(-1.0, 1.0, n_days) * spread
+    volume = rng.integers(100_000, 50_000_000, n_days)
+    time_series = {
+        day: {'1. open': f'{o:.4f}',
+              '2. high': f'{max(o, c) + s:.4f}',
+              '3. low': f'{min(o, c) - s:.4f}',
+              '4. close': f'{c:.4f}',
+              '5. adjusted close': f'{c:.4f}',
+              '6. volume': str(v),
+              '7. dividend amount': '0.0000',
+              '8. split coefficient': '1.0000'}
+        for day, o, c, s, v in zip(_business_days(n_days), open_.tolist(),
+                                   close.tolist(), spread.tolist(), volume.tolist())}
+    return {'Meta Data': {'1. Information': 'Daily Time Series with Splits and Dividend Events',
+                          '2. Symbol': symbol,
+                          '3. Last Refreshed': str(_LAST_DAY),
+                          '4. Output Size': 'Full size',
+                          '5. Time Zone': 'US/Eastern'},
+            'Time Series (Daily)': time_series}
+
+
+def synthetic_fx(function: str, from_symbol: str, to_symbol: str, n_days: int = 1000) -> dict:
+    rng = np.random.default_rng(_seed(function, from_symbol, to_symbol))
+    rate = np.exp(np.cumsum(rng.normal(0.0, 0.005, n_days)))[::-1]
+    step = {'FX_DAILY': 1, 'FX_WEEKLY': 5, 'FX_MONTHLY': 21}[function]
+    days = _business_days(n_days * step)[::step]
+    name = function[len('FX_'):].capitalize()
+    return {'Meta Data': {'1. Information': f'Forex {name} Prices (open, high, low, close)',
+                          '2. From Symbol': from_symbol,
+                          '3. To Symbol': to_symbol,
+                          '4. Last Refreshed': str(_LAST_DAY)},
+            f'Time Series FX ({name})': {
+                day: {'1. open': f'{r:.5f}', '2. high': f'{r * 1.002:.5f}',
+                      '3. low': f'{r * 0.998:.5f}', '4. close': f'{r:.5f}'}
+                for day, r in zip(days, rate.tolist())}}
+
+
+class FakeAlphaVantage(object):
+
+    def __init__(self, data_dir: str = None, latency: float = 0.0,
+                 latency_jitter: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, calls_per_minute: int = 0,
+                 synthetic_days: int = 5000, seed: int = None):
+        self._data_dir = data_dir
+        self._latency = latency
+        self._latency_jitter = latency_jitter
+        self._error_rate = error_rate
+        self._throttle_rate = throttle_rate
+        self._calls_per_minute = calls_per_minute
+        self._synthetic_days = synthetic_days
+        self._random = random.Random(seed)
+        self._calls = {}  # apikey -> deque of call times, for calls_per_minute
+        self._files = {}
+        self.stats = {'requests': 0, 'errors': 0, 'throttled': 0}
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/query', self.handle_query)
+        return app
+
+    async def handle_query(self, request: web.Request) -> web.Response:
+        self.stats['requests'] += 1
+        if self._latency or self._latency_jitter:
+            await asyncio.sleep(self._latency + self._random.uniform(0, self._latency_jitter))
+
+        if self._error_rate and self._random.random() < self._error_rate:
+            self.stats['errors'] += 1
+            return web.Response(status=self._random.choice([500, 502, 503]))
+        if self._throttled(request.query.get('apikey', '')):
+            self.stats['throttled'] += 1
+            return web.json_response({'Note': _THROTTLE_NOTE})
+
+        query = request.query
+        function = query.get('function', '').upper()
+        try:
+            if function == 'TIME_SERIES_DAILY_ADJUSTED':
+                return web.Response(body=self._time_series_body(
+                    query['symbol'], query.get('outputsize', 'compact')),
+                    content_type='application/json')
+            if function == 'GLOBAL_QUOTE':
+                data = self._quote(query['symbol'])
+            elif function == 'CURRENCY_EXCHANGE_RATE':
+                data = self._exchange_rate(query['from_currency'], query['to_currency'])
+            elif function in ('FX_DAILY', 'FX_WEEKLY', 'FX_MONTHLY'):
+                data = synthetic_fx(function, query['from_symbol'], query['to_symbol'])
+            else:
+                raise KeyError(function)
+        except KeyError:
+            return web.json_response({'Error Message': 'Invalid API call. Please retry or visit '
+                                      'the documentation for ' + function})
+        return web.Response(body=json.dumps(data).encode(), content_type='application/json')
+
+    def _throttled(self, apikey: str) -> bool:
+        if self._throttle_rate and self._random.random() < self._throttle_rate:
+            return True
+        if not self._calls_per_minute:
+            return False
+        now = time.monotonic()
+        calls = self._calls.setdefault(apikey, deque())
+        while calls and calls[0] <= now - 60.0:
+            calls.popleft()
+        if len(calls) >= self._calls_per_minute:
+            return True
+        calls.append(now)
+        return False
+
+    def _time_series(self, symbol: str, outputsize: str) -> dict:
+        data = self._from_file(symbol) or synthetic_time_series(
+            symbol.lower(), self._synthetic_days)
+        return FakeAlphaVantage._slice(data, outputsize)
+
+    @staticmethod
+    def _slice(data: dict, outputsize: str) -> dict:
+        if outputsize == 'compact':
+            time_series = data['Time Series (Daily)']
+            data = dict(data, **{'Time Series (Daily)': {
+                day: time_series[day] for day in list(time_series)[:100]}})
+        return data
+
+    @lru_cache(maxsize=2 * _SYNTHETIC_POOL)
+    def _synthetic_body(self, slot: int, outputsize: str) -> bytes:
+        data = synthetic_time_series(f'{_SYMBOL_PLACEHOLDER}{slot}', self._synthetic_days)
+        data = dict(data, **{'Meta Data': dict(data['Meta Data'],
+                                               **{'2. Symbol': _SYMBOL_PLACEHOLDER})})
+        return json.dumps(FakeAlphaVantage._slice(data, outputsize)).encode()
+
+    def _time_series_body(self, symbol: str, outputsize: str) -> bytes:
+        if self._from_file(symbol) is not None:
+            return json.dumps(self._time_series(symbol, outputsize)).encode()
+        body = self._synthetic_body(_seed(symbol) % _SYNTHETIC_POOL, outputsize)
+        return body.replace(_SYMBOL_PLACEHOLDER.encode(), json.dumps(symbol)[1:-1].encode(), 1)
+
+    def _from_file(self, symbol: str):
+        if not self._data_dir:
+            return None
+        path = os.path.join(self._data_dir, f'data_{symbol.lower()}.json')
+        if path not in self._files:
+            self._files[path] = None
+            if os.path.exists(resolve(path)):
+                self._files[path] = read_snapshot(path)
+        return self._files[path]
+
+    def _quote(self, symbol: str) -> dict:
+        time_series = self._time_series(symbol, 'compact')['Time Series (Daily)']
+        (day, bar), (_, prev) = list(time_series.items())[:2]
+        change = float(bar['4. close']) - float(prev['4. close'])
+        return {'Global Quote': {
+            '01. symbol': symbol.upper(),
+            '02. open': bar['1. open'],
+            '03. high': bar['2. high'],
+            '04. low': bar['3. low'],
+            '05. price': bar['4. close'],
+            '06. volume': bar['6. volume'],
+            '07. latest trading day': day,
+            '08. previous close': prev['4. close'],
+            '09. change': f'{change:.4f}',
+            '10. change percent': f'{100.0 * change / float(prev["4. close"]):.4f}%'}}
+
+    def _exchange_rate(self, from_currency: str, to_currency: str) -> dict:
+        rate = 0.5 + (_seed(from_currency, to_currency) % 10_000) / 1_000.0
+        return {'Realtime Currency Exchange Rate': {
+            '1. From_Currency Code': from_currency.upper(),
+            '2. From_Currency Name': from_currency.upper(),
+            '3. To_Currency Code': to_currency.upper(),
+            '4. To_Currency Name': to_currency.upper(),
+            '5. Exchange Rate': f'{rate:.8f}',
+            '6. Last Refreshed': f'{_LAST_DAY} 16:00:00',
+            '7. Time Zone': 'UTC',
+            '8. Bid Price': f'{rate * 0.9999:.8f}',
+            '9. Ask Price': f'{rate * 1.0001:.8f}'}}
+
+
+async def start_server(fake: FakeAlphaVantage, host: str = '127.0.0.1',
+                       port: int = 8765) -> web.AppRunner:
+    # starts serving on the running loop, stop with `await runner.cleanup()`
+    runner = web.AppRunner(fake.make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s,%(msecs)d %(levelname)s: %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    parser = argparse.ArgumentParser(
+        description='Local stand-in for the Alpha Vantage API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--calls-per-minute', type=int, default=0)
+    parser.add_argument('--synthetic-days', type=int, default=5000)
+    args = parser.parse_args(sys.argv[1:])
+
+    fake = FakeAlphaVantage(args.data_dir, args.latency, args.latency_jitter,
+                            args.error_rate, args.throttle_rate,
+                            args.calls_per_minute, args.synthetic_days)
+    log.info("Serving fake Alpha Vantage on http://%s:%d/query", args.host, args.port)
+    web.run_app(fake.make_app(), host=args.host, port=args.port, access_log=None)
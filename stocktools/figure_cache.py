@@ -0,0 +1,184 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import sys
+import json
+import glob
+import math
+import hashlib
+import logging
+import pandas as pd
+from stocktools.frame_cache import cached_json_to_df, data_version
+from stocktools.plotting import ohlc_data
+from stocktools.store import STORE_DIR
+from stocktools.timing import span
+
+log = logging
+
+# Serialized main_graph data (what the ohlc_store ships to the browser, see
+# plotting.ohlc_data), keyed on (symbol, data version, view). It only
+# changes when the symbol's data file is rewritten, so every
+# user asking for the same symbol and view gets the same bytes. Entries are
+# files (one per key, written atomically) so all the app's worker processes
+# share them, and the OS page cache keeps the hot ones in memory:
+#   data/data_store/figures/aapl-<data version>-<view hash>.json
+#
+# Bump _FORMAT whenever the builder's output changes.
+
+_FORMAT = 3
+_MAX_FIGURES_PER_SYMBOL = 64
+_EPOCH = pd.Timestamp('1970-01-01')
+_DAY = pd.Timedelta(days=1)
+
+
+def snap_range(x_range=None):
+    # widens a zoomed range out to a grid of whole days, the largest power
+    # of two no wider than an eighth of the range, so nearby pans and zooms
+    # share one entry instead of each writing its own. The builder pads the
+    # range by half its width, the view asked for stays covered
+    if x_range is None or x_range == 'all':
+        return x_range
+    start, end = x_range
+    days = max((end - start) / _DAY, 1.0)
+    step = 2 ** max(0, math.floor(math.log2(max(days / 8, 1.0))))
+    first = math.floor((start - _EPOCH) / _DAY / step) * step
+    last = math.ceil((end - _EPOCH) / _DAY / step) * step
+    return _EPOCH + first * _DAY, _EPOCH + max(last, first + step) * _DAY
+
+
+def view_key(x_range=None) -> str:
+    # relayout_range() output as a string, None and 'all' both autorange
+    if x_range is None or x_range == 'all':
+        return 'all'
+    return '/'.join(ts.isoformat() for ts in x_range)
+
+
+class FigureCache(object):
+    """
+    Read-through cache of builder(symbol, co_df, x_range) json for one data
+    directory, ohlc_data by default:
+
+        cache = FigureCache('data/data_raw')
+        data = cache.get('AAPL', relayout_range(relayoutData))
+
+    get() returns the decoded dict, ready to be returned from a callback.
+    warm() builds the default views ahead of the first request.
+    """
+
+    def __init__(self, raw_dir: str, directory: str = None, builder=ohlc_data,
+                 max_per_symbol: int = _MAX_FIGURES_PER_SYMBOL):
+        self._raw_dir = raw_dir
+        self._builder = builder
+        self._directory = directory or os.path.join(
+            os.path.dirname(os.path.abspath(raw_dir.rstrip('/'))), STORE_DIR, 'figures')
+        self._max_per_symbol = max_per_symbol
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, symbol: str, x_range=None) -> dict:
+        text = self.get_json(symbol, x_range)
+        with span('figure_cache.decode'):
+            return json.loads(text)
+
+    def get_json(self, symbol: str, x_range=None) -> str:
+        symbol = symbol.lower()
+        x_range = snap_range(x_range)
+        json_path = self._json_path(symbol)
+        path = self._entry_path(symbol, data_version(json_path), view_key(x_range))
+        try:
+            with span('figure_cache.read'), open(path) as f:
+                text = f.read()
+            self.hits += 1
+            return text
+        except FileNotFoundError:
+            self.misses += 1
+
+        with span('figure_cache.frame'):
+            co_df = cached_json_to_df(os.path.basename(json_path), path=json_path)
+        with span('figure_cache.build'):
+            data = self._builder(symbol, co_df, x_range)
+        with span('figure_cache.serialize'):
+            text = json.dumps(data)
+        with span('figure_cache.write'):
+            self._write(path, text)
+        self._prune(symbol, path)
+        return text
+
+    def warm(self, symbols: list, views: list = ('all',)) -> int:
+        # builds whatever isn't cached yet, returns how many were built
+        misses = self.misses
+        for symbol in symbols:
+            for x_range in views:
+                self.get_json(symbol, x_range)
+        built = self.misses - misses
+        log.info("Warmed %d figures, %d built", len(symbols) * len(views), built)
+        return built
+
+    def invalidate(self, symbol: str = None):
+        pattern = f'{symbol.lower()}-*.json' if symbol else '*.json'
+        for path in glob.glob(os.path.join(self._directory, pattern)):
+            FigureCache._remove(path)
+
+    def stats(self) -> dict:
+        paths = glob.glob(os.path.join(self._directory, '*.json'))
+        return {'entries': len(paths),
+                'bytes': sum(os.path.getsize(path) for path in paths),
+                'hits': self.hits,
+                'misses': self.misses}
+
+    def _json_path(self, symbol: str) -> str:
+        return os.path.join(self._raw_dir, f'data_{symbol}.json')
+
+    def _entry_path(self, symbol: str, version: tuple, view: str) -> str:
+        version = '{}_{}'.format(*version)
+        view = hashlib.sha1(f'{_FORMAT}:{self._builder.__name__}:{view}'.encode()
+                            ).hexdigest()[:16]
+        return os.path.join(self._directory, f'{symbol}-{version}-{view}.json')
+
+    def _write(self, path: str, text: str):
+        os.makedirs(self._directory, exist_ok=True)
+        # unique per process so concurrent workers don't share a temp file
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def _prune(self, symbol: str, current: str):
+        # drops the symbol's figures of older data versions, and its least
+        # recently written views past max_per_symbol
+        version = os.path.basename(current).split('-')[1]
+        paths = glob.glob(os.path.join(self._directory, f'{symbol}-*.json'))
+        stale = [path for path in paths if os.path.basename(path).split('-')[1] != version]
+        for path in stale:
+            FigureCache._remove(path)
+        paths = [path for path in paths if path not in stale]
+        if len(paths) > self._max_per_symbol:
+            paths.sort(key=FigureCache._mtime)
+            for path in paths[:len(paths) - self._max_per_symbol]:
+                FigureCache._remove(path)
+
+    @staticmethod
+    def _mtime(path: str) -> float:
+        try:
+            return os.path.getmtime(path)
+        except FileNotFoundError:
+            return 0.0
+
+    @staticmethod
+    def _remove(path: str):
+        # another worker may have removed it first
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == "__main__":
+    # python -m stocktools.figure_cache data/data_raw AAPL MSFT ...
+    logging.basicConfig(level=logging.INFO)
+    raw_dir = sys.argv[1] if len(sys.argv) > 1 else '../data/data_raw/'
+    FigureCache(raw_dir).warm(sys.argv[2:])
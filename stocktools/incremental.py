@@ -0,0 +1,70 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+from stocktools.snapshot import read_snapshot, resolve
+
+# merging an outputsize=compact response (the latest 100 bars) into the
+# stored full history of a symbol, see FetchAlphaVantage(incremental=True)
+
+_TIME_SERIES_KEY = 'Time Series (Daily)'
+
+
+def read_stored_response(path: str):
+    if not os.path.exists(resolve(path)):
+        return None
+    data = read_snapshot(path)
+    return data if data.get(_TIME_SERIES_KEY) else None
+
+
+def last_stored_date(stored: dict):
+    # dates are ISO strings, so the lexical max is the latest day
+    return max(stored[_TIME_SERIES_KEY]) if stored else None
+
+
+def new_bars(stored: dict, compact: dict) -> dict:
+    last_date = last_stored_date(stored)
+    return {date: bar for date, bar in compact[_TIME_SERIES_KEY].items()
+            if last_date is None or date > last_date}
+
+
+def needs_full_history(stored: dict, compact: dict) -> bool:
+    # the compact window can't be merged when there is nothing to merge it
+    # into or when it doesn't reach back to the last stored day (days would
+    # be missing in between). A split or dividend among the new bars is
+    # applied to the stored adjusted closes instead, see rescale_adjusted_close
+    if not stored or not compact.get(_TIME_SERIES_KEY):
+        return True
+    return min(compact[_TIME_SERIES_KEY]) > last_stored_date(stored)
+
+
+def merge_time_series(stored: dict, compact: dict) -> dict:
+    # newest first like the api responses, compact values win on overlap
+    time_series = dict(stored[_TIME_SERIES_KEY])
+    time_series.update(compact[_TIME_SERIES_KEY])
+    merged = dict(stored)
+    merged['Meta Data'] = dict(stored.get('Meta Data', {}))
+    if 'Meta Data' in compact:
+        merged['Meta Data']['3. Last Refreshed'] = \
+            compact['Meta Data'].get('3. Last Refreshed')
+    merged[_TIME_SERIES_KEY] = {date: time_series[date]
+                                for date in sorted(time_series, reverse=True)}
+    return merged
+
+
+def rescale_adjusted_close(merged: dict, before: str, scale: float) -> dict:
+    # multiplies the adjusted close of the days before `before` (the ones
+    # the compact window didn't bring fresh) by scale, see adjust.scale_since.
+    # Written at full precision: rounding to the api's 4 decimals on every
+    # event would compound on small early prices (pre-split aapl is ~$0.1)
+    if scale == 1.0:
+        return merged
+    time_series = merged[_TIME_SERIES_KEY]
+    for date, bar in time_series.items():
+        if date < before:
+            bar = time_series[date] = dict(bar)
+            bar['5. adjusted close'] = repr(float(bar['5. adjusted close']) * float(scale))
+    return merged
@@ -0,0 +1,483 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import math
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Technical indicators as NumPy kernels plus O(1)-per-bar streaming states.
+#
+# Kernels take price arrays sorted by ascending date, either 1-D (one
+# symbol) or 2-D with one column per symbol, and work along axis 0. Leading
+# NaNs (a symbol that listed later than the others) are skipped per column;
+# the output is NaN until the indicator has seen enough bars.
+#
+# Each *State class keeps the running state of the matching kernel so the
+# next bar is an O(1) update(); from_history() seeds it from the kernel
+# output instead of replaying the whole series bar by bar.
+
+TRADING_DAYS_PER_YEAR = 252
+
+# exp(-_EMA_BLOCK_LOG) bounds the dynamic range of one closed-form EMA block
+_EMA_BLOCK_LOG = 27.0
+
+
+def _as_2d(values):
+    x = np.asarray(values, dtype='float64')
+    return (x[:, None], True) if x.ndim == 1 else (x, False)
+
+
+def _restore(out, was_1d):
+    return out[:, 0] if was_1d else out
+
+
+def _first_valid(x):
+    # index of the first non NaN row per column (len(x) for all NaN columns)
+    if len(x) == 0:
+        return np.zeros(x.shape[1], dtype='int64')
+    valid = ~np.isnan(x)
+    return np.where(valid.any(axis=0), valid.argmax(axis=0), len(x))
+
+
+def sma(values, window: int):
+    x, was_1d = _as_2d(values)
+    out = np.full_like(x, np.nan)
+    if window <= len(x):
+        out[window - 1:] = sliding_window_view(x, window, axis=0).mean(axis=-1)
+    return _restore(out, was_1d)
+
+
+def rolling_std(values, window: int, ddof: int = 0):
+    x, was_1d = _as_2d(values)
+    out = np.full_like(x, np.nan)
+    if window <= len(x):
+        out[window - 1:] = sliding_window_view(
+            x, window, axis=0).std(axis=-1, ddof=ddof)
+    return _restore(out, was_1d)
+
+
+def rolling_max(values, window: int, min_periods: int = None):
+    return _rolling_extreme(values, window, min_periods, np.maximum, -np.inf)
+
+
+def rolling_min(values, window: int, min_periods: int = None):
+    return _rolling_extreme(values, window, min_periods, np.minimum, np.inf)
+
+
+def _rolling_extreme(values, window, min_periods, ufunc, identity):
+    # van Herk / Gil-Werman: split the rows into blocks of `window`, then any
+    # window is the suffix of one block joined with the prefix of the next,
+    # so it's two accumulates instead of a reduce over every window
+    x, was_1d = _as_2d(values)
+    min_periods = window if min_periods is None else min_periods
+    n, m = x.shape
+    n_blocks = -(-n // window)
+    blocks = np.full((n_blocks * window, m), identity)
+    blocks[:n] = np.where(np.isnan(x), identity, x)
+    blocks = blocks.reshape(n_blocks, window, m)
+
+    prefix = ufunc.accumulate(blocks, axis=1).reshape(-1, m)[:n]
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, m)
+    out = prefix.copy()
+    # rows before the first full window only have a prefix
+    if n >= window:
+        out[window - 1:] = ufunc(suffix[:n - window + 1], prefix[window - 1:])
+
+    valid = np.cumsum(~np.isnan(x), axis=0)
+    counts = valid.copy()
+    counts[window:] -= valid[:-window]
+    out[(counts < max(min_periods, 1)) | np.isinf(out)] = np.nan
+    return _restore(out, was_1d)
+
+
+def _ema_alpha(span=None, alpha=None):
+    if (span is None) == (alpha is None):
+        raise ValueError('pass exactly one of span or alpha')
+    if alpha is None:
+        if span < 1:
+            raise ValueError('span must be >= 1')
+        alpha = 2.0 / (span + 1.0)
+    if not 0.0 < alpha <= 1.0:
+        raise ValueError('alpha must be in (0, 1]')
+    return alpha
+
+
+def _ema_kernel(x, alpha, out=None):
+    # y[t] = (1 - alpha) * y[t-1] + alpha * x[t], y[0] = x[0] for a NaN free
+    # 2-D x. The recursion is solved in closed form over blocks short enough
+    # that beta ** -block stays well inside float64 range, so the whole
+    # series is a few dozen vectorized cumsums instead of a python loop
+    out = np.empty_like(x) if out is None else out
+    if alpha == 1.0 or len(x) == 0:
+        out[:] = x
+        return out
+    beta = 1.0 - alpha
+    block = max(1, min(len(x), int(_EMA_BLOCK_LOG / -math.log(beta))))
+    powers = beta ** np.arange(block + 1, dtype='float64')
+    carry = x[0]
+    start = 0
+    while start < len(x):
+        stop = min(start + block, len(x))
+        n = stop - start
+        scaled = np.cumsum(x[start:stop] / powers[:n, None], axis=0)
+        out[start:stop] = powers[1:n + 1, None] * carry + \
+            alpha * powers[:n, None] * scaled
+        carry = out[stop - 1]
+        start = stop
+    return out
+
+
+def ema(values, span=None, alpha=None, min_periods: int = None, out=None):
+    # same as pandas' ewm(span=..., adjust=False, min_periods=...).mean() on
+    # series without gaps; interior NaNs are carried forward. out is an
+    # array shaped like values to write the result into
+    alpha = _ema_alpha(span, alpha)
+    x, was_1d = _as_2d(values)
+    if min_periods is None:
+        min_periods = int(span) if span is not None else 1
+
+    first = _first_valid(x)
+    filled = _fill_gaps(x, first)
+    out = _ema_kernel(filled, alpha, None if out is None else _as_2d(out)[0])
+
+    rows = np.arange(len(x))[:, None]
+    out[rows < first + max(min_periods, 1) - 1] = np.nan
+    return _restore(out, was_1d)
+
+
+def _fill_gaps(x, first):
+    # back fill the leading NaNs with the first valid value (the EMA of a
+    # constant is that constant, so y[first] still equals x[first]) and
+    # forward fill the interior ones
+    if not np.isnan(x).any():
+        return x
+    rows = np.arange(len(x))[:, None]
+    idx = np.where(np.isnan(x), 0, rows)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    idx = np.maximum(idx, np.minimum(first, len(x) - 1))
+    filled = np.take_along_axis(x, idx, axis=0)
+    return np.where(np.isnan(filled), 0.0, filled)
+
+
+def macd(values, fast: int = 12, slow: int = 26, signal: int = 9):
+    macd_line = ema(values, span=fast) - ema(values, span=slow)
+    signal_line = ema(macd_line, span=signal)
+    return macd_line, signal_line, macd_line - signal_line
+
+
+def rsi(values, window: int = 14):
+    # Wilder's RSI, gains and losses smoothed with alpha = 1 / window
+    x, was_1d = _as_2d(values)
+    delta = np.diff(x, axis=0, prepend=np.nan)
+    gains = np.where(np.isnan(delta), np.nan, np.clip(delta, 0.0, None))
+    losses = np.where(np.isnan(delta), np.nan, np.clip(-delta, 0.0, None))
+    avg_gain = ema(gains, alpha=1.0 / window, min_periods=window)
+    avg_loss = ema(losses, alpha=1.0 / window, min_periods=window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    out = np.where((avg_loss == 0.0) & ~np.isnan(avg_gain), 100.0, out)
+    return _restore(out, was_1d)
+
+
+def bollinger(values, window: int = 20, k: float = 2.0):
+    middle = sma(values, window)
+    width = k * rolling_std(values, window)
+    return middle - width, middle, middle + width
+
+
+def true_range(high, low, close):
+    high, was_1d = _as_2d(high)
+    low = _as_2d(low)[0]
+    close = _as_2d(close)[0]
+    prev_close = np.concatenate([np.full((1, close.shape[1]), np.nan), close[:-1]])
+    out = np.fmax(high - low, np.fmax(np.abs(high - prev_close),
+                                      np.abs(low - prev_close)))
+    return _restore(out, was_1d)
+
+
+def atr(high, low, close, window: int = 14):
+    return ema(true_range(high, low, close), alpha=1.0 / window,
+               min_periods=window)
+
+
+def high_low_52wk(high, low, window: int = TRADING_DAYS_PER_YEAR,
+                  min_periods: int = 1):
+    return (rolling_max(high, window, min_periods),
+            rolling_min(low, window, min_periods))
+
+
+def _valid_tail(values, window):
+    # the last `window` non NaN values, what a state that skips NaNs holds
+    values = np.asarray(values, dtype='float64')
+    return values[~np.isnan(values)][-window:]
+
+
+class SMAState(object):
+
+    def __init__(self, window: int):
+        self.window = window
+        self._values = deque(maxlen=window)
+        self._sum = 0.0
+        self.value = math.nan
+
+    @classmethod
+    def from_history(cls, values, window: int):
+        state = cls(window)
+        tail = _valid_tail(values, window)
+        state._values.extend(tail.tolist())
+        state._sum = float(tail.sum())
+        if len(tail) == window:
+            state.value = state._sum / window
+        return state
+
+    def update(self, x: float) -> float:
+        # a missing bar is skipped, the average is over the last `window`
+        # valid ones
+        if math.isnan(x):
+            return self.value
+        if len(self._values) == self.window:
+            self._sum -= self._values[0]
+        self._values.append(x)
+        self._sum += x
+        if len(self._values) == self.window:
+            self.value = self._sum / self.window
+        return self.value
+
+
+class EMAState(object):
+
+    def __init__(self, span=None, alpha=None, min_periods: int = None):
+        self.alpha = _ema_alpha(span, alpha)
+        if min_periods is None:
+            min_periods = int(span) if span is not None else 1
+        self.min_periods = max(min_periods, 1)
+        self._ema = math.nan
+        self.count = 0
+
+    @classmethod
+    def from_history(cls, values, span=None, alpha=None, min_periods: int = None):
+        state = cls(span, alpha, min_periods)
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if len(values):
+            state._ema = float(_ema_kernel(values[:, None], state.alpha)[-1, 0])
+            state.count = len(values)
+        return state
+
+    @property
+    def value(self) -> float:
+        return self._ema if self.count >= self.min_periods else math.nan
+
+    def update(self, x: float) -> float:
+        if not math.isnan(x):
+            if self.count == 0:
+                self._ema = x
+            else:
+                self._ema += self.alpha * (x - self._ema)
+            self.count += 1
+        return self.value
+
+
+class MACDState(object):
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self._fast = EMAState(span=fast)
+        self._slow = EMAState(span=slow)
+        self._signal = EMAState(span=signal)
+
+    @classmethod
+    def from_history(cls, values, fast: int = 12, slow: int = 26, signal: int = 9):
+        state = cls(fast, slow, signal)
+        state._fast = EMAState.from_history(values, span=fast)
+        state._slow = EMAState.from_history(values, span=slow)
+        macd_line = macd(values, fast, slow, signal)[0]
+        state._signal = EMAState.from_history(macd_line, span=signal)
+        return state
+
+    @property
+    def value(self) -> tuple:
+        macd_line = self._fast.value - self._slow.value
+        signal_line = self._signal.value
+        return macd_line, signal_line, macd_line - signal_line
+
+    def update(self, x: float) -> tuple:
+        self._fast.update(x)
+        self._slow.update(x)
+        self._signal.update(self._fast.value - self._slow.value)
+        return self.value
+
+
+class RSIState(object):
+
+    def __init__(self, window: int = 14):
+        self._gain = EMAState(alpha=1.0 / window, min_periods=window)
+        self._loss = EMAState(alpha=1.0 / window, min_periods=window)
+        self._prev = math.nan
+
+    @classmethod
+    def from_history(cls, values, window: int = 14):
+        state = cls(window)
+        values = np.asarray(values, dtype='float64')
+        delta = np.diff(values)
+        state._gain = EMAState.from_history(
+            np.clip(delta, 0.0, None), alpha=1.0 / window, min_periods=window)
+        state._loss = EMAState.from_history(
+            np.clip(-delta, 0.0, None), alpha=1.0 / window, min_periods=window)
+        if len(values):
+            state._prev = float(values[-1])
+        return state
+
+    @property
+    def value(self) -> float:
+        gain, loss = self._gain.value, self._loss.value
+        if math.isnan(gain) or math.isnan(loss):
+            return math.nan
+        return 100.0 if loss == 0.0 else 100.0 - 100.0 / (1.0 + gain / loss)
+
+    def update(self, x: float) -> float:
+        if not math.isnan(self._prev):
+            delta = x - self._prev
+            self._gain.update(max(delta, 0.0))
+            self._loss.update(max(-delta, 0.0))
+        self._prev = x
+        return self.value
+
+
+class BollingerState(object):
+    # rolling mean and sum of squared deviations (Welford's update, with the
+    # oldest value swapped out once the window is full), which keeps the
+    # variance accurate where sum(x * x) / n - mean * mean cancels
+
+    def __init__(self, window: int = 20, k: float = 2.0):
+        self.window = window
+        self.k = k
+        self._values = deque(maxlen=window)
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    @classmethod
+    def from_history(cls, values, window: int = 20, k: float = 2.0):
+        state = cls(window, k)
+        tail = _valid_tail(values, window)
+        state._values.extend(tail.tolist())
+        if len(tail):
+            state._mean = float(tail.mean())
+            state._m2 = float(((tail - state._mean) ** 2).sum())
+        return state
+
+    @property
+    def value(self) -> tuple:
+        n = len(self._values)
+        if n < self.window:
+            return math.nan, math.nan, math.nan
+        std = math.sqrt(max(self._m2, 0.0) / n)
+        return self._mean - self.k * std, self._mean, self._mean + self.k * std
+
+    def update(self, x: float) -> tuple:
+        # a missing bar is skipped like in SMAState
+        if math.isnan(x):
+            return self.value
+        if len(self._values) == self.window:
+            oldest = self._values[0]
+            self._values.append(x)
+            mean = self._mean + (x - oldest) / self.window
+            self._m2 += (x - oldest) * (x - mean + oldest - self._mean)
+            self._mean = mean
+        else:
+            self._values.append(x)
+            delta = x - self._mean
+            self._mean += delta / len(self._values)
+            self._m2 += delta * (x - self._mean)
+        return self.value
+
+
+class ATRState(object):
+
+    def __init__(self, window: int = 14):
+        self._atr = EMAState(alpha=1.0 / window, min_periods=window)
+        self._prev_close = math.nan
+
+    @classmethod
+    def from_history(cls, high, low, close, window: int = 14):
+        state = cls(window)
+        state._atr = EMAState.from_history(true_range(high, low, close),
+                                           alpha=1.0 / window, min_periods=window)
+        close = np.asarray(close, dtype='float64')
+        if len(close):
+            state._prev_close = float(close[-1])
+        return state
+
+    @property
+    def value(self) -> float:
+        return self._atr.value
+
+    def update(self, high: float, low: float, close: float) -> float:
+        tr = high - low
+        if not math.isnan(self._prev_close):
+            tr = max(tr, abs(high - self._prev_close), abs(low - self._prev_close))
+        self._prev_close = close
+        return self._atr.update(tr)
+
+
+class RollingExtremeState(object):
+    # rolling max (or min with mode='min') over the last `window` bars with a
+    # monotonic deque, amortized O(1) per update
+
+    def __init__(self, window: int, mode: str = 'max'):
+        if mode not in ('max', 'min'):
+            raise ValueError("mode must be 'max' or 'min'")
+        self.window = window
+        self._sign = 1.0 if mode == 'max' else -1.0
+        self._candidates = deque()  # (bar number, signed value)
+        self._bars = 0
+
+    @classmethod
+    def from_history(cls, values, window: int, mode: str = 'max'):
+        state = cls(window, mode)
+        for x in np.asarray(values, dtype='float64')[-window:].tolist():
+            state.update(x)
+        return state
+
+    @property
+    def value(self) -> float:
+        if not self._candidates:
+            return math.nan
+        return self._sign * self._candidates[0][1]
+
+    def update(self, x: float) -> float:
+        self._bars += 1
+        if not math.isnan(x):
+            signed = self._sign * x
+            while self._candidates and self._candidates[-1][1] <= signed:
+                self._candidates.pop()
+            self._candidates.append((self._bars, signed))
+        while self._candidates and self._candidates[0][0] <= self._bars - self.window:
+            self._candidates.popleft()
+        return self.value
+
+
+class HighLow52WkState(object):
+
+    def __init__(self, window: int = TRADING_DAYS_PER_YEAR):
+        self._high = RollingExtremeState(window, 'max')
+        self._low = RollingExtremeState(window, 'min')
+
+    @classmethod
+    def from_history(cls, high, low, window: int = TRADING_DAYS_PER_YEAR):
+        state = cls(window)
+        state._high = RollingExtremeState.from_history(high, window, 'max')
+        state._low = RollingExtremeState.from_history(low, window, 'min')
+        return state
+
+    @property
+    def value(self) -> tuple:
+        return self._high.value, self._low.value
+
+    def update(self, high: float, low: float) -> tuple:
+        self._high.update(high)
+        self._low.update(low)
+        return self.value
@@ -0,0 +1,168 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import re
+import json
+import os
+import numpy as np
+from stocktools.store import DTYPES, FIELDS
+from stocktools.snapshot import SUFFIX, open_snapshot, resolve
+
+# Incremental decoder for TIME_SERIES_DAILY_ADJUSTED responses. Chunks of
+# the response (read from a file or an aiohttp stream) are scanned for
+# complete day objects, whose value strings go straight into typed column
+# buffers, so the nested dict of dicts of strings that json.load builds is
+# never materialised. Only the unscanned tail of the text and one chunk's
+# worth of value strings are held besides the columns themselves.
+#
+#     decoder = BarsDecoder()
+#     for chunk in chunks:
+#         decoder.feed(chunk)
+#     bars = decoder.close()  # same layout as store.bars_from_response
+
+CHUNK_SIZE = 1 << 16
+
+_TIME_SERIES_KEY = re.compile(rb'"Time Series \(Daily\)"\s*:\s*\{')
+_DAY = rb'"(\d{4}-\d{2}-\d{2})"\s*:\s*\{'
+# a day with its fields in the order the api sends them, the common case
+_DAY_FIXED = re.compile(_DAY + b','.join(
+    rb'\s*"' + re.escape(key.encode()) + rb'"\s*:\s*"([^"]*)"' for key in FIELDS) + rb'\s*\}')
+# any other complete day object and its "key": "value" pairs
+_DAY_ANY = re.compile(_DAY + rb'([^{}]*)\}')
+_PAIR = re.compile(rb'"([^"]*)"\s*:\s*"([^"]*)"')
+
+_COLUMNS = ['Date'] + list(FIELDS.values())
+# bytes per day of an indented response, to size the buffers up front
+_BYTES_PER_DAY = 280
+# gzipped snapshots run about 10x smaller than the indented text
+_GZIP_RATIO = 10
+
+
+class BarsDecoder(object):
+
+    def __init__(self, size_hint: int = None):
+        capacity = max(16, (size_hint or 0) // _BYTES_PER_DAY + 1)
+        self._columns = {name: np.empty(capacity, dtype=DTYPES[name])
+                         for name in _COLUMNS}
+        self._n = 0
+        self._buffer = b''
+        self._in_time_series = False
+
+    def feed(self, chunk: bytes):
+        buffer = self._buffer + chunk
+        if not self._in_time_series:
+            # everything before the time series (meta data, or a whole
+            # throttle/error payload) is kept until the key shows up
+            match = _TIME_SERIES_KEY.search(buffer)
+            if match is None:
+                self._buffer = buffer
+                return
+            self._in_time_series = True
+            buffer = buffer[match.end():]
+        self._buffer = buffer[self._scan(buffer):]
+
+    def close(self) -> dict:
+        # the bars sorted by ascending date, or None when the response held
+        # no time series (see payload())
+        if not self._in_time_series:
+            return None
+        days, end = BarsDecoder._scan_any(self._buffer)
+        if days:
+            self._append(days)
+        # a body cut short still holds complete days, only the closing
+        # braces of the series and of the document tell it was all there
+        rest = self._buffer[end:].strip()
+        if len(rest) < 2 or not rest.startswith(b'}') or not rest.endswith(b'}'):
+            raise json.JSONDecodeError('time series cut short after %d days' % self._n,
+                                       rest[:64].decode('utf-8', 'replace'), 0)
+        n = self._n
+        bars = self._columns
+        for values in bars.values():
+            values.resize(n, refcheck=False)
+        dates = bars['Date']
+        if n > 1 and not (dates[1:] < dates[:-1]).all():
+            order = np.argsort(dates, kind='stable')
+            return {name: values[order] for name, values in bars.items()}
+        # newest first as sent, flip in place
+        for values in bars.values():
+            values[:] = values[::-1]
+        return bars
+
+    def payload(self):
+        # a response without a time series is small (a "Note" or an
+        # "Error Message"), decode it whole
+        return json.loads(self._buffer) if self._buffer.strip() else None
+
+    def _scan(self, buffer: bytes) -> int:
+        # decodes the complete days in buffer, returns where the rest starts
+        days = _DAY_FIXED.findall(buffer)
+        end = 0
+        if days:
+            end = _DAY_FIXED.match(buffer, buffer.rfind(b'"' + days[-1][0] + b'"')).end()
+            # one "{" per day object, any day the fixed pattern skipped shows up
+            if buffer.count(b'{', 0, end) != len(days):
+                days = None
+        if not days:
+            # fields out of order or missing somewhere, go day by day
+            days, end = self._scan_any(buffer)
+        if days:
+            self._append(days)
+        return end
+
+    @staticmethod
+    def _scan_any(buffer: bytes) -> tuple:
+        days = []
+        end = 0
+        for match in _DAY_ANY.finditer(buffer):
+            fields = dict(_PAIR.findall(match.group(2)))
+            days.append((match.group(1),) + tuple(fields.get(key.encode(), b'nan')
+                                                  for key in FIELDS))
+            end = match.end()
+        return days, end
+
+    def _append(self, days: list):
+        n = self._n + len(days)
+        capacity = len(self._columns['Date'])
+        if n > capacity:
+            capacity = max(n, 2 * capacity)
+            for values in self._columns.values():
+                values.resize(capacity, refcheck=False)
+        for name, strings in zip(_COLUMNS, zip(*days)):
+            strings = np.array(strings)
+            if name == 'Date':
+                strings = strings.astype(DTYPES['Date'])
+            elif DTYPES[name] == 'int64':
+                strings = strings.astype('float64')
+            self._columns[name][self._n:n] = strings
+        self._n = n
+
+
+def decode_file(path: str, chunk_size: int = CHUNK_SIZE) -> dict:
+    # path may name the .json of a symbol that has a compressed snapshot
+    path = resolve(path)
+    size_hint = os.path.getsize(path)
+    if path.endswith(SUFFIX):
+        size_hint *= _GZIP_RATIO
+    decoder = BarsDecoder(size_hint)
+    with open_snapshot(path) as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            decoder.feed(chunk)
+    bars = decoder.close()
+    if bars is None:
+        raise ValueError(f'no "Time Series (Daily)" in {path}')
+    return bars
+
+
+async def decode_chunks(chunks, size_hint: int = None, sink=None) -> BarsDecoder:
+    # feeds an async iterator of bytes, e.g. aiohttp's
+    # response.content.iter_chunked(CHUNK_SIZE), optionally copying every
+    # chunk to a writable file as it goes
+    decoder = BarsDecoder(size_hint)
+    async for chunk in chunks:
+        decoder.feed(chunk)
+        if sink is not None:
+            sink.write(chunk)
+    return decoder
@@ -1,56 +1,93 @@
 #!/usr/bin/env python
 
 
-import json
 import pandas as pd
+from stocktools.indicators import ema, sma
+from stocktools.store import date_slice, is_fresh, load_bars, store_path_for
+from stocktools.timing import span
+
+
+# frame column -> the stored columns it is computed from
+DERIVED = {'AdjFactor': ('AdjClose', 'Close'),
+           'AdjOpen': ('Open', 'AdjClose', 'Close'),
+           'AdjHigh': ('High', 'AdjClose', 'Close'),
+           'AdjLow': ('Low', 'AdjClose', 'Close'),
+           'SMA_20day': ('AdjClose',),
+           'EMA_20day': ('AdjClose',)}
+INDICATORS = ('SMA_20day', 'EMA_20day')
 
 
 def json_to_df(file_name: str,
                path=None,
-               columns=['Date', 'Open', 'High', 'Low', 'Close', 'AdjClose', 'Volume']):
+               columns=None,
+               start=None,
+               end=None):
+    # columns=None is every stored and derived column; a selection and the
+    # [start, end] date range are pushed down into the read, only what they
+    # need is loaded. The indicators still warm up on the AdjClose history
+    # before start so their values don't depend on the range
+
+    if path is None:
+        path_to_file = f'../data/data_raw/{file_name}'
+    else:
+        path_to_file = path
 
-    def read_json_file(file_name: str) -> dict:
-        if path is None:
-            path_to_file = f'../data/data_raw/{file_name}'
+    stored = None
+    if columns is not None:
+        stored = ['Date']
+        for name in columns:
+            stored += [source for source in DERIVED.get(name, (name,)) if source not in stored]
+    wants_indicators = columns is None or any(name in INDICATORS for name in columns)
+
+    # prefer the compacted columnar copy (see stocktools/store.py) when it
+    # is at least as new as the json it was built from
+    with span('json_to_df.load_bars'):
+        warmup = None
+        if start is None or not wants_indicators:
+            bars = load_bars(path_to_file, stored, start, end)
+        elif is_fresh(store_path_for(path_to_file), path_to_file):
+            # two row-range reads of the store
+            bars = load_bars(path_to_file, stored, start, end)
+            warmup = load_bars(path_to_file, ['AdjClose'], None, end)['AdjClose']
         else:
-            path_to_file = path
-        with open(path_to_file) as f:
-            return json.load(f)
-
-    def convert_response(d):
-        for date, stock_data in d['Time Series (Daily)'].items():
-            r = {'Date': date}
-            r.update(stock_data)
-            yield r
-
-    df = pd.DataFrame(convert_response(read_json_file(file_name)))
-    df.rename(columns={'1. open': 'Open',
-                       '2. high': 'High',
-                       '3. low': 'Low',
-                       '4. close': 'Close',
-                       '5. adjusted close': 'AdjClose',
-                       '6. volume': 'Volume',
-                       '7. dividend amount': 'DivAmount',
-                       '8. split coefficient': 'SplitRatio'}, inplace=True)
-
-    df['Date'] = pd.to_datetime(df['Date'])
-    df[["Open", "High", "Low", "Close", "AdjClose"]] = df[[
-        "Open", "High", "Low", "Close", "AdjClose"]].astype("float64")
-    df["Volume"] = df["Volume"].astype("int64")
-    df["AdjFactor"] = df["AdjClose"] / df["Close"]
-    df["AdjOpen"] = df["Open"] * df["AdjFactor"]
-    df["AdjHigh"] = df["High"] * df["AdjFactor"]
-    df["AdjLow"] = df["Low"] * df["AdjFactor"]
-
-    df.sort_values(by=['Date'], inplace=True)
-
-    df['SMA_20day'] = df[['AdjClose']].rolling(window=20).mean()
-
-    df['EMA_20day'] = df[['AdjClose']].ewm(
-        span=20, min_periods=20, adjust=False).mean()
+            # the json is decoded whole either way, once, and both the
+            # window and the warmup history are sliced from it
+            history = load_bars(path_to_file, stored, None, end)
+            rows = date_slice(history['Date'], start, None)
+            bars = {name: values[rows] for name, values in history.items()}
+            warmup = history['AdjClose']
+    return bars_to_df(bars, columns, warmup)
+
+
+def bars_to_df(bars: dict, columns=None, warmup=None) -> pd.DataFrame:
+    # bars are sorted by ascending date, the frame keeps the newest-first
+    # row order of the alpha vantage response. warmup is an AdjClose history
+    # ending on the same day as bars for the indicators to start from
+    with span('json_to_df.frame'):
+        df = pd.DataFrame({name: values[::-1] for name, values in bars.items()})
+
+        df['Date'] = pd.to_datetime(df['Date'])
+        if 'AdjClose' in df and 'Close' in df:
+            df["AdjFactor"] = df["AdjClose"] / df["Close"]
+            for name in ('Open', 'High', 'Low'):
+                if name in df:
+                    df[f"Adj{name}"] = df[name] * df["AdjFactor"]
+
+        df.sort_values(by=['Date'], inplace=True)
+
+    # the frame is in ascending date order here, so the kernels' output
+    # lines up with the rows positionally
+    if 'AdjClose' in df and (columns is None or any(name in INDICATORS for name in columns)):
+        with span('json_to_df.indicators'):
+            close = df['AdjClose'].to_numpy() if warmup is None else warmup
+            rows = slice(len(close) - len(df), len(close))
+
+            df['SMA_20day'] = sma(close, 20)[rows]
+
+            df['EMA_20day'] = ema(close, span=20)[rows]
 
     # df.set_index('Date', inplace=True)
     df.sort_index(inplace=True)
-    # extract the default columns
-    # df = df[columns]
+    if columns is not None:
+        df = df[columns]
     return df
@@ -1,11 +1,18 @@
 
 
-def SMA():
-    pass
+from stocktools.indicators import ema, macd, sma
 
 
-def EMA():
-    pass
+def SMA(values, window: int = 20):
+    return sma(values, window)
+
+
+def EMA(values, span: int = 20):
+    return ema(values, span=span)
+
+
+def MACD(values, fast: int = 12, slow: int = 26, signal: int = 9):
+    return macd(values, fast, slow, signal)
 
 
 """
@@ -0,0 +1,253 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import json
+import base64
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+
+def ohlc_hovertext(co_df: pd.DataFrame) -> list:
+    # column-wise version of the per-row hovertext loop the OHLC callbacks
+    # used to run; it produces the exact same strings. Columns are pulled out
+    # as whole arrays/lists once instead of one Series.__getitem__ per cell
+    dates = np.datetime_as_string(
+        co_df['Date'].values.astype('datetime64[D]'), unit='D').tolist()
+    opens = co_df['AdjOpen'].round(4).tolist()
+    highs = co_df['AdjHigh'].round(4).tolist()
+    lows = co_df['AdjLow'].round(4).tolist()
+    closes = co_df['AdjClose'].tolist()
+
+    return [f"{d[5:7]}/{d[8:10]}/{d[:4]}<br>O: {o}\tH: {h}<br>L: {l}\tC: {c}"
+            for d, o, h, l, c in zip(dates, opens, highs, lows, closes)]
+
+
+# level of detail for the OHLC figures: a browser can't show more candles
+# than the plot is wide in pixels, so anything past _MAX_POINTS bars in the
+# visible range is aggregated to weekly and then monthly candles
+_MAX_POINTS = 800
+_BARS_PER_PERIOD = {'D': 1, 'W': 5, 'M': 21}
+_LOD_LABELS = {'D': 'daily', 'W': 'weekly', 'M': 'monthly'}
+
+
+def select_lod_freq(n_bars: int, max_points: int = _MAX_POINTS) -> str:
+    for freq, bars_per_period in _BARS_PER_PERIOD.items():
+        if n_bars / bars_per_period <= max_points:
+            return freq
+    return 'M'
+
+
+def resample_ohlc(co_df: pd.DataFrame, freq: str) -> pd.DataFrame:
+    # aggregate a json_to_df frame to weekly ('W') or monthly ('M') candles.
+    # Each candle is dated on the last trading day of its period so it isn't
+    # hidden by the weekend rangebreaks
+    co_df = co_df.sort_values(by=['Date'])
+    if freq == 'D':
+        return co_df.reset_index(drop=True)
+
+    grouped = co_df.groupby(co_df['Date'].dt.to_period(freq), sort=True)
+    agg = {'Date': 'last',
+           'AdjOpen': 'first',
+           'AdjHigh': 'max',
+           'AdjLow': 'min',
+           'AdjClose': 'last',
+           'Volume': 'sum'}
+    agg.update({name: 'last' for name in ['SMA_20day', 'EMA_20day']
+                if name in co_df.columns})
+    return grouped.agg(agg).reset_index(drop=True)
+
+
+def relayout_range(relayout_data):
+    # visible x range out of a dcc.Graph relayoutData event, 'all' for an
+    # autorange (the "all" rangeselector button, double click) and None for
+    # events that don't move the x axis (autosize, legend clicks, ...)
+    if not relayout_data:
+        return None
+    if relayout_data.get('xaxis.autorange'):
+        return 'all'
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        x_range = relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    elif 'xaxis.range' in relayout_data:
+        x_range = relayout_data['xaxis.range']
+    else:
+        return None
+    try:
+        start, end = pd.Timestamp(x_range[0]), pd.Timestamp(x_range[1])
+    except (ValueError, TypeError, OverflowError):
+        # not a date the client should have sent, show everything
+        return 'all'
+    if pd.isna(start) or pd.isna(end):
+        return 'all'
+    return (start, end) if start <= end else (end, start)
+
+
+def lod_frame(co_df: pd.DataFrame, x_range=None, max_points: int = _MAX_POINTS):
+    # slice co_df to the visible range (padded by half its width on both
+    # sides so short pans don't run off the data) and pick the resolution
+    # that keeps it under max_points candles
+    if x_range is not None and x_range != 'all':
+        start, end = x_range
+        pad = (end - start) / 2
+        co_df = co_df[(co_df['Date'] >= start - pad) & (co_df['Date'] <= end + pad)]
+
+    freq = select_lod_freq(len(co_df), max_points)
+    return resample_ohlc(co_df, freq), freq
+
+
+def lod_label(freq: str) -> str:
+    return _LOD_LABELS[freq]
+
+
+def ohlc_figure(symbol: str, co_df: pd.DataFrame, x_range=None) -> go.Figure:
+    # the main_graph candlestick figure of a json_to_df frame for the given
+    # relayout_range() view
+    co_df, freq = lod_frame(co_df, x_range)
+
+    title = f"{symbol.lower()} Historical Graph ({lod_label(freq)})"
+    hovertext = ohlc_hovertext(co_df)
+
+    trace_ohlc = go.Candlestick(x=co_df['Date'],
+                                open=co_df['AdjOpen'],
+                                high=co_df['AdjHigh'],
+                                low=co_df['AdjLow'],
+                                close=co_df['AdjClose'],
+                                text=hovertext,
+                                hoverinfo='text',
+                                name="OHLC"
+                                # increasing_line_color='#0048BA',
+                                # decreasing_line_color='#E60000'
+                                )
+    trace_sma_20_day = go.Scatter(
+        x=co_df['Date'], y=co_df['SMA_20day'], name="SMA_20day", visible=True)
+    trace_ema_20_day = go.Scatter(
+        x=co_df['Date'], y=co_df['EMA_20day'], name="EMA_20day")
+
+    fig = go.Figure(data=[trace_ohlc, trace_sma_20_day, trace_ema_20_day],
+                    layout=go.Layout(ohlc_layout(title, x_range)))
+    return fig
+
+
+def ohlc_layout(title: str, x_range=None) -> dict:
+    layout = dict(
+        title=dict(text=title),
+        # width=1200,
+        # height=600,
+        # plot_bgcolor=colors['background'],
+        paper_bgcolor='#F9F9F9',
+        xaxis=dict(
+            rangebreaks=[
+                dict(bounds=["sat", "mon"]),  # hide weekends
+                # hide Christmas and New Year's
+                dict(values=["2015-12-25", "2016-01-01"])
+            ],
+            rangeselector=dict(
+                buttons=list([
+                    dict(count=1,
+                         label="1m",
+                         step="month",
+                         stepmode="backward"),
+                    dict(count=6,
+                         label="6m",
+                         step="month",
+                         stepmode="backward"),
+                    dict(count=1,
+                         label="YTD",
+                         step="year",
+                         stepmode="todate"),
+                    dict(count=1,
+                         label="1y",
+                         step="year",
+                         stepmode="backward"),
+                    dict(step="all")
+                ])
+            ),
+            rangeslider=dict(
+                visible=False
+            ),
+            type="date"
+        )
+    )
+    if x_range is None or x_range == 'all':
+        layout['xaxis']['autorange'] = True
+    else:
+        layout['xaxis']['range'] = [ts.isoformat() for ts in x_range]
+    return layout
+
+
+# payload-optimised version of ohlc_figure: the same chart as a plain dict
+# with every column as a plotly.js typed array ({"dtype", "bdata"}), prices
+# as float32 (7 significant digits, well past the cent for any price here),
+# dates as float64 ms since the epoch (what a date axis uses internally),
+# and hover labels formatted by plotly.js instead of a string per candle.
+# Needs plotly.js >= 2.28 for typed arrays (dash >= 2.15)
+
+_X_HOVER = '%m/%d/%Y'
+_Y_HOVER = '.2f'
+
+
+def typed_array(values, dtype: str) -> dict:
+    # plotly.js reads bdata as little endian
+    values = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(values.tobytes()).decode()}
+
+
+def _date_ms(dates: pd.Series) -> np.ndarray:
+    return dates.values.astype('datetime64[ms]').astype('float64')
+
+
+@lru_cache(maxsize=1)
+def _template() -> dict:
+    # what go.Figure would attach, serialized once
+    return json.loads(go.Figure().to_json())['layout']['template']
+
+
+# The arrays of a view are shipped to the browser once (a dcc.Store) and
+# turned into a figure there by assets/ohlc.js, so switching overlays or the
+# chart style never reaches the server. ohlc_figure_from_data is the same
+# function in python, for the server rendered figure.
+
+OVERLAYS = ('SMA_20day', 'EMA_20day')
+STYLES = ('candlestick', 'ohlc', 'line')
+
+
+def ohlc_data(symbol: str, co_df: pd.DataFrame, x_range=None) -> dict:
+    co_df, freq = lod_frame(co_df, x_range)
+
+    def prices(name):
+        return typed_array(co_df[name].to_numpy(), 'f4')
+
+    layout = ohlc_layout(f"{symbol.lower()} Historical Graph ({lod_label(freq)})", x_range)
+    layout['template'] = _template()
+    # keeps zoom and legend state when overlays or style change
+    layout['uirevision'] = symbol.lower()
+    return {'x': typed_array(_date_ms(co_df['Date']), 'f8'),
+            'open': prices('AdjOpen'),
+            'high': prices('AdjHigh'),
+            'low': prices('AdjLow'),
+            'close': prices('AdjClose'),
+            'overlays': {name: prices(name) for name in OVERLAYS},
+            'layout': layout}
+
+
+def ohlc_figure_from_data(data: dict, overlays=OVERLAYS, style: str = 'candlestick') -> dict:
+    hover = {'xhoverformat': _X_HOVER, 'yhoverformat': _Y_HOVER}
+    if style == 'line':
+        traces = [dict(type='scatter', name='AdjClose', x=data['x'], y=data['close'],
+                       **hover)]
+    else:
+        traces = [dict(type=style, name='OHLC', x=data['x'],
+                       open=data['open'], high=data['high'],
+                       low=data['low'], close=data['close'], **hover)]
+    traces += [dict(type='scatter', name=name, x=data['x'], y=data['overlays'][name],
+                    **hover)
+               for name in OVERLAYS if name in overlays]
+    return {'data': traces, 'layout': data['layout']}
+
+
+def ohlc_payload(symbol: str, co_df: pd.DataFrame, x_range=None) -> dict:
+    return ohlc_figure_from_data(ohlc_data(symbol, co_df, x_range))
@@ -0,0 +1,186 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import sys
+import json
+import logging
+import numpy as np
+import pandas as pd
+from stocktools.store import STORE_DIR, date_slice, load_bars
+from stocktools.snapshot import raw_files
+from stocktools.universe import Panel, adjusted_fields
+
+# library module, the CLI below configures logging
+log = logging.getLogger(__name__)
+
+# Every symbol's bars in one date aligned, memory mapped file:
+#   data/data_store/universe.mat
+#
+#   magic | header length | json header | dates | values
+#
+# dates is the union of every symbol's trading days (datetime64[D]) and
+# values is float64 symbols x fields x dates, NaN where a symbol has no bar.
+# Each symbol's field is one contiguous run of days, so a symbol or a date
+# range of it is a slice of the mapping: no parse, no copy, and every
+# process that opens the file reads the same page cache.
+#
+#     matrix = open_matrix()
+#     closes = matrix.symbol('aapl', '2019-01-01', '2019-12-31')['AdjClose']
+
+MATRIX_NAME = 'universe.mat'
+MATRIX_FIELDS = ('Open', 'High', 'Low', 'Close', 'AdjClose', 'Volume')
+
+_MAGIC = b'STKMAT01'
+_ALIGN = 64
+
+
+def matrix_path_for(raw_dir: str) -> str:
+    # data/data_raw -> data/data_store/universe.mat
+    return os.path.join(os.path.dirname(os.path.abspath(raw_dir.rstrip('/'))),
+                        STORE_DIR, MATRIX_NAME)
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def write_matrix(bars_by_symbol: dict, path: str):
+    symbols = list(bars_by_symbol)
+    dates = np.unique(np.concatenate(
+        [bars['Date'] for bars in bars_by_symbol.values()])).astype('datetime64[D]')
+    header = {'symbols': symbols, 'fields': list(MATRIX_FIELDS),
+              'n_dates': len(dates), 'dtype': 'float64'}
+    header_bytes = json.dumps(header).encode()
+    dates_offset = _aligned(len(_MAGIC) + 8 + len(header_bytes))
+    values_offset = _aligned(dates_offset + dates.nbytes)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        f.seek(dates_offset)
+        f.write(dates.tobytes())
+        f.seek(values_offset)
+        # one symbol at a time, the whole matrix is never in memory
+        for symbol in symbols:
+            bars = bars_by_symbol[symbol]
+            block = np.full((len(MATRIX_FIELDS), len(dates)), np.nan)
+            rows = np.searchsorted(dates, bars['Date'])
+            for i, name in enumerate(MATRIX_FIELDS):
+                block[i, rows] = bars[name]
+            f.write(block.tobytes())
+    # readers that have the old file mapped keep it until they reopen
+    os.replace(tmp_path, path)
+
+
+def build_matrix(raw_dir: str = '../data/data_raw/', path: str = None,
+                 symbols: list = None) -> str:
+    files = raw_files(raw_dir)
+    if symbols is not None:
+        files = {symbol: files[symbol.lower()] for symbol in symbols}
+    path = path or matrix_path_for(raw_dir)
+    write_matrix({symbol: load_bars(json_path, ['Date'] + list(MATRIX_FIELDS))
+                  for symbol, json_path in files.items()}, path)
+    log.info("Wrote %d symbols to %s", len(files), path)
+    return path
+
+
+def is_fresh(path: str, raw_dir: str) -> bool:
+    # written after every raw snapshot it was built from
+    try:
+        built = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    return all(os.stat(json_path).st_mtime_ns <= built
+               for json_path in raw_files(raw_dir).values())
+
+
+class PriceMatrix(object):
+    """
+    Read-only views on a universe.mat file. Everything returned by symbol()
+    and field() is a slice of the memory mapping, not a copy, and stays
+    valid while the PriceMatrix is referenced; frame() and panel() build
+    new objects for code that wants pandas or the universe panel.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f'not a price matrix file: {path}')
+            header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = json.loads(f.read(header_len))
+        self.symbols = header['symbols']
+        self.fields = header['fields']
+        self._symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._field_index = {name: i for i, name in enumerate(self.fields)}
+
+        n_dates = header['n_dates']
+        dates_offset = _aligned(len(_MAGIC) + 8 + header_len)
+        self.dates = np.memmap(path, dtype='datetime64[D]', mode='r',
+                               offset=dates_offset, shape=(n_dates,))
+        self.values = np.memmap(path, dtype=header['dtype'], mode='r',
+                                offset=_aligned(dates_offset + 8 * n_dates),
+                                shape=(len(self.symbols), len(self.fields), n_dates))
+
+    def date_slice(self, start=None, end=None) -> slice:
+        # inclusive [start, end] on the date axis
+        return date_slice(self.dates, start, end)
+
+    def symbol(self, symbol: str, start=None, end=None) -> dict:
+        # field -> days view for one symbol, plus the matching 'Date' view
+        days = self.date_slice(start, end)
+        values = self.values[self._symbol_index[symbol.lower()], :, days]
+        bars = {'Date': self.dates[days]}
+        bars.update(zip(self.fields, values))
+        return bars
+
+    def field(self, name: str, start=None, end=None) -> np.ndarray:
+        # symbols x days view of one field
+        return self.values[:, self._field_index[name], self.date_slice(start, end)]
+
+    def frame(self, symbol: str, start=None, end=None) -> pd.DataFrame:
+        # ascending-date frame of the days the symbol traded
+        bars = self.symbol(symbol, start, end)
+        traded = ~np.isnan(bars['Close'])
+        return pd.DataFrame({name: values[traded] for name, values in bars.items()})
+
+    def panel(self, symbols: list = None, start=None, end=None) -> Panel:
+        # the adjusted date x symbol panel stocktools.universe computes on
+        symbols = [symbol.lower() for symbol in symbols or self.symbols]
+        days = self.date_slice(start, end)
+        columns = {symbol: adjusted_fields(self.symbol(symbol, start, end)) for symbol in symbols}
+        return Panel(np.asarray(self.dates[days]), symbols,
+                     {name: np.column_stack([columns[symbol][name] for symbol in symbols])
+                      for name in next(iter(columns.values()))})
+
+
+_open_matrices = {}
+
+
+def open_matrix(path: str = None, raw_dir: str = '../data/data_raw/') -> PriceMatrix:
+    # one mapping per file and process, reopened once the file is rebuilt
+    path = path or matrix_path_for(raw_dir)
+    version = os.stat(path).st_mtime_ns
+    matrix, opened_version = _open_matrices.get(path, (None, None))
+    if matrix is None or opened_version != version:
+        matrix = PriceMatrix(path)
+        _open_matrices[path] = (matrix, version)
+    return matrix
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s,%(msecs)d %(levelname)s: %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    # python -m stocktools.price_matrix data/data_raw [out.mat]
+    raw_dir = sys.argv[1] if len(sys.argv) > 1 else '../data/data_raw/'
+    build_matrix(raw_dir, sys.argv[2] if len(sys.argv) > 2 else None)
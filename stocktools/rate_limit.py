@@ -0,0 +1,189 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import json
+import time
+import asyncio
+import logging
+
+log = logging
+
+# Alpha Vantage's free tier allows 5 calls per minute and 500 calls per day.
+# RateLimiter holds one token bucket per budget and a call goes out as soon
+# as every bucket has a token, so it only waits for a bucket that is
+# actually empty, and only as long as it takes that bucket to get a token
+# back. A spent token comes back exactly `period` seconds after it was
+# spent (rather than trickling back at capacity / period), so no window of
+# `period` seconds ever sees more than `capacity` calls while a full bucket
+# can still burst. The buckets can be persisted to a json file so separate
+# runs share the same budget.
+
+
+# the budget is kept next to the data it was spent on, so every fetcher and
+# the scheduler writing to one directory share it
+STATE_FILE = '.rate_limit.json'
+
+
+def state_path_for(data_dir: str) -> str:
+    return os.path.join(data_dir, STATE_FILE)
+
+
+class Clock(object):
+    # wall clock for the buckets (time.time survives restarts, unlike
+    # time.monotonic) and the matching sleep
+
+    def time(self) -> float:
+        return time.time()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class FakeClock(Clock):
+    """
+    Test harness clock: sleep() doesn't wait, it moves time forward, so a
+    day's worth of rate limiting runs instantly and deterministically.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        # let the other waiting tasks run like a real sleep would
+        await asyncio.sleep(0)
+
+
+class TokenBucket(object):
+
+    def __init__(self, capacity: int, period: float, spent: list = None):
+        self.capacity = capacity
+        self.period = period
+        self._spent = sorted(spent or [])  # times the outstanding tokens were spent
+
+    def refill(self, now: float):
+        expired = 0
+        while expired < len(self._spent) and self._spent[expired] + self.period <= now:
+            expired += 1
+        del self._spent[:expired]
+
+    @property
+    def tokens(self) -> int:
+        return self.capacity - len(self._spent)
+
+    def wait_time(self, now: float) -> float:
+        # seconds until one token is available (call refill first)
+        if self.tokens > 0:
+            return 0.0
+        return self._spent[len(self._spent) - self.capacity] + self.period - now
+
+    def take(self, now: float):
+        self._spent.append(now)
+
+    def to_dict(self) -> dict:
+        return {'capacity': self.capacity, 'period': self.period,
+                'spent': self._spent}
+
+
+class RateLimiter(object):
+    _PER_MINUTE = 5
+    _PER_DAY = 500
+
+    def __init__(self, per_minute: int = _PER_MINUTE, per_day: int = _PER_DAY,
+                 state_path: str = None, clock: Clock = None):
+        self._clock = clock or Clock()
+        self._state_path = state_path
+        self._buckets = {'minute': TokenBucket(per_minute, 60.0),
+                         'day': TokenBucket(per_day, 24 * 60 * 60.0)}
+        self._lock = asyncio.Lock()
+        self._load_state()
+
+    async def acquire(self):
+        # waits until a call is allowed under every budget and consumes it;
+        # callers go through in the order they arrived
+        async with self._lock:
+            while True:
+                now = self._clock.time()
+                for bucket in self._buckets.values():
+                    bucket.refill(now)
+                wait = max(bucket.wait_time(now) for bucket in self._buckets.values())
+                if wait <= 0.0:
+                    break
+                log.info("Rate limit reached, waiting %.1fs", wait)
+                await self._clock.sleep(wait)
+            for bucket in self._buckets.values():
+                bucket.take(now)
+            self._save_state()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def remaining(self) -> dict:
+        now = self._clock.time()
+        for bucket in self._buckets.values():
+            bucket.refill(now)
+        return {name: bucket.tokens for name, bucket in self._buckets.items()}
+
+    def _load_state(self):
+        if not self._state_path or not os.path.exists(self._state_path):
+            return
+        try:
+            with open(self._state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            log.warning("Ignoring unreadable rate limit state: %s", self._state_path)
+            return
+        for name, bucket in self._buckets.items():
+            saved = state.get(name)
+            # a saved bucket only applies to the same budget
+            if saved and saved['capacity'] == bucket.capacity and \
+                    saved['period'] == bucket.period:
+                self._buckets[name] = TokenBucket(bucket.capacity, bucket.period,
+                                                  saved['spent'])
+
+    def _save_state(self):
+        if not self._state_path:
+            return
+        tmp_path = self._state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({name: bucket.to_dict()
+                       for name, bucket in self._buckets.items()}, f)
+        os.replace(tmp_path, self._state_path)
+
+
+async def simulate(n_calls: int, limiter: RateLimiter, clock: FakeClock) -> list:
+    # fake clock harness: the time (relative to the start) each of n_calls
+    # concurrent callers was let through
+    start = clock.time()
+    times = []
+
+    async def call():
+        await limiter.acquire()
+        times.append(clock.time() - start)
+
+    await asyncio.gather(*[call() for _ in range(n_calls)])
+    return times
+
+
+if __name__ == "__main__":
+    # a 38 symbol refresh against the default budget
+    clock = FakeClock()
+    times = asyncio.run(simulate(38, RateLimiter(clock=clock), clock))
+    print(f"38 calls done after {times[-1]:.0f}s (fake clock), "
+          f"first 10 at {[round(t) for t in times[:10]]}")
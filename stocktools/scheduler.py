@@ -0,0 +1,222 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import sys
+import asyncio
+import argparse
+import logging
+import threading
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from stocktools.alpha_vantage_v2 import FetchAlphaVantage
+from stocktools.figure_cache import FigureCache
+from stocktools.frame_cache import data_version, frame_cache
+from stocktools.price_matrix import build_matrix, matrix_path_for
+from stocktools.rate_limit import Clock, RateLimiter, state_path_for
+from stocktools.snapshot import raw_files
+
+# library module, the CLI below configures logging
+log = logging.getLogger(__name__)
+
+# Keeps data/data_raw current while the dashboard serves it: incremental
+# FetchAlphaVantage runs every `interval` seconds inside the exchange
+# window (weekdays 6am - 2pm Pacific), nothing outside it. Snapshots and
+# store copies are replaced atomically (temp file + os.replace, see
+# snapshot.SnapshotWriter and store.write_store), so readers see the old
+# file or the new one, and every serving cache is keyed on the file's
+# version. After a run, on_refreshed(symbols) gets the symbols that were
+# updated so the caches can be rebuilt before a request asks for them.
+#
+# As a sidecar next to the gunicorn workers (one fetcher for all of them,
+# they share the rewarmed figure cache and price matrix through the files):
+#
+#     python -m stocktools.scheduler data/data_raw
+#
+# or in process, on its own thread and event loop, so request threads
+# never wait on the network:
+#
+#     scheduler = RefreshScheduler(DATA_DIR, on_refreshed=cache_refresher(DATA_DIR))
+#     scheduler.start()
+
+MARKET_TZ = ZoneInfo('America/Los_Angeles')
+MARKET_WINDOW = (time(6, 0), time(14, 0))
+# the whole universe once an hour stays well under the 500 calls a day
+REFRESH_INTERVAL = 60 * 60.0
+
+
+def in_window(now: datetime, window: tuple = MARKET_WINDOW) -> bool:
+    now = now.astimezone(MARKET_TZ)
+    return now.weekday() < 5 and window[0] <= now.time() < window[1]
+
+
+def seconds_until_window(now: datetime, window: tuple = MARKET_WINDOW) -> float:
+    # 0 inside the window, otherwise until the next weekday's opening
+    if in_window(now, window):
+        return 0.0
+    now = now.astimezone(MARKET_TZ)
+    for days in range(8):
+        day = now.date() + timedelta(days=days)
+        opens = datetime.combine(day, window[0], tzinfo=MARKET_TZ)
+        if opens.weekday() < 5 and opens > now:
+            return (opens - now).total_seconds()
+    raise ValueError(f'no weekday window opening after {now}')
+
+
+def cache_refresher(raw_dir: str, figure_cache: FigureCache = None):
+    """
+    on_refreshed hook for the caches built on raw_dir: drops this process's
+    frames of the updated symbols, builds their default figures and
+    rebuilds the price matrix if there is one.
+    """
+    figure_cache = figure_cache or FigureCache(raw_dir)
+
+    def on_refreshed(symbols: list):
+        for symbol in symbols:
+            frame_cache.invalidate(os.path.join(raw_dir, f'data_{symbol}.json'))
+        figure_cache.warm(symbols)
+        matrix_path = matrix_path_for(raw_dir)
+        if os.path.exists(matrix_path):
+            build_matrix(raw_dir, matrix_path)
+
+    return on_refreshed
+
+
+class RefreshScheduler(object):
+    """
+    Runs incremental refreshes of raw_dir's symbols (or the given ones) on a
+    cadence inside the exchange window. run_forever() on a running loop,
+    or start() / stop() to run it on a background thread.
+    """
+
+    def __init__(self, raw_dir: str, symbols: list = None, interval: float = REFRESH_INTERVAL,
+                 window: tuple = MARKET_WINDOW, api_key: str = None, base_url: str = None,
+                 on_refreshed=None, clock: Clock = None, rate_limit_state: str = None):
+        self._raw_dir = raw_dir
+        # the budget file shared with other fetchers of raw_dir by default
+        self._rate_limit_state = rate_limit_state or state_path_for(raw_dir)
+        self._symbols = symbols
+        self._interval = interval
+        self._window = window
+        self._api_key = api_key
+        self._base_url = base_url
+        self._on_refreshed = on_refreshed
+        self._clock = clock or Clock()
+        self._rate_limiter = None
+        self._thread = None
+        self._loop = None
+        self._task = None
+        self._started = threading.Event()
+        self.runs = 0
+        self.failures = {}
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self._clock.time(), MARKET_TZ)
+
+    async def run_once(self) -> list:
+        # symbols refreshed in this run, a failed run is logged and retried
+        # on the next tick
+        symbols = self._symbols or list(raw_files(self._raw_dir))
+        if self._rate_limiter is None:
+            # one budget shared across runs, persisted like FetchAlphaVantage's
+            self._rate_limiter = RateLimiter(state_path=self._rate_limit_state,
+                                             clock=self._clock)
+        versions = {symbol: self._version(symbol) for symbol in symbols}
+        try:
+            fetcher = FetchAlphaVantage(self._api_key, "time_series_daily_adjusted",
+                                        symbols=symbols, out_path=self._raw_dir,
+                                        incremental=True, rate_limiter=self._rate_limiter,
+                                        base_url=self._base_url, run=False)
+            results = await fetcher.refresh()
+        except Exception:
+            log.exception("Refresh of %s failed", self._raw_dir)
+            return []
+        self.runs += 1
+        # only the files that were rewritten, most runs merge no new bars
+        refreshed = [result.symbol for result in results if result.error is None and
+                     self._version(result.symbol) != versions[result.symbol]]
+        # the symbols whose last attempt failed, and why; a symbol leaves it
+        # on its next good run
+        for result in results:
+            if result.error is None:
+                self.failures.pop(result.symbol, None)
+            else:
+                self.failures[result.symbol] = result.error
+        log.info("Refreshed %d of %d symbols", len(refreshed), len(symbols))
+        failed = [result for result in results if result.error is not None]
+        if failed:
+            log.warning("%d symbols failed: %s", len(failed),
+                        '; '.join(f'{result.symbol}: {result.error}' for result in failed))
+        if refreshed and self._on_refreshed is not None:
+            # cache rebuilds are cpu bound, off the loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._on_refreshed, refreshed)
+        return refreshed
+
+    async def run_forever(self):
+        while True:
+            wait = seconds_until_window(self.now(), self._window)
+            if wait > 0:
+                log.info("Outside the exchange window, next refresh in %.0fs", wait)
+                await self._clock.sleep(wait)
+                continue
+            started = self._clock.time()
+            await self.run_once()
+            await self._clock.sleep(max(0.0, self._interval - (self._clock.time() - started)))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run_thread, name='refresh-scheduler',
+                                        daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self, timeout: float = None):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._task.cancel)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _version(self, symbol: str):
+        try:
+            return data_version(os.path.join(self._raw_dir, f'data_{symbol}.json'))
+        except FileNotFoundError:
+            return None
+
+    def _run_thread(self):
+        self._loop = asyncio.new_event_loop()
+        self._task = self._loop.create_task(self.run_forever())
+        self._started.set()
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s,%(msecs)d %(levelname)s: %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    parser = argparse.ArgumentParser(
+        description='refresh the raw data on a cadence inside the exchange window')
+    parser.add_argument('raw_dir', nargs='?', default='../data/data_raw/')
+    parser.add_argument('--symbols', nargs='*', default=None)
+    parser.add_argument('--interval', type=float, default=REFRESH_INTERVAL)
+    parser.add_argument('--once', action='store_true',
+                        help='one refresh now, window or not')
+    args = parser.parse_args()
+
+    scheduler = RefreshScheduler(args.raw_dir, args.symbols, args.interval,
+                                 on_refreshed=cache_refresher(args.raw_dir))
+    try:
+        asyncio.run(scheduler.run_once() if args.once else scheduler.run_forever())
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,210 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import logging
+
+# library module, the CLI below configures logging
+log = logging.getLogger(__name__)
+
+# Raw api responses are kept as gzipped, non-indented json next to where
+# the indented .json used to be:
+#   data/data_raw/data_aapl.json -> data/data_raw/data_aapl.json.gz
+# Callers keep passing the .json path around, resolve() maps it to the
+# snapshot that is actually on disk, and both formats read the same:
+#
+#     python -m stocktools.snapshot data/data_raw    # one-shot migration
+
+SUFFIX = '.gz'
+# level 6 is within a few % of 9's size at a sixth of the cost, FAST_LEVEL
+# is for writes on an event loop (about 25% bigger, 3x quicker)
+COMPRESS_LEVEL = 6
+FAST_LEVEL = 1
+_SEPARATORS = (',', ':')
+_WHITESPACE = b' \t\n\r'
+
+
+def snapshot_path(json_path: str) -> str:
+    return json_path if json_path.endswith(SUFFIX) else json_path + SUFFIX
+
+
+def resolve(json_path: str) -> str:
+    # the compressed snapshot when there is one, otherwise the path as given
+    path = snapshot_path(json_path)
+    return path if os.path.exists(path) else json_path
+
+
+def raw_files(raw_dir: str) -> dict:
+    # symbol -> resolved snapshot path for every data_<symbol>.json[.gz]
+    paths = glob.glob(os.path.join(raw_dir, 'data_*.json')) + \
+        glob.glob(os.path.join(raw_dir, 'data_*.json' + SUFFIX))
+    names = {os.path.basename(path).split('.')[0] for path in paths}
+    return {name[len('data_'):]: resolve(os.path.join(raw_dir, f'{name}.json'))
+            for name in sorted(names)}
+
+
+def open_snapshot(path: str):
+    # binary file object over the decompressed json
+    return gzip.open(path, 'rb') if path.endswith(SUFFIX) else open(path, 'rb')
+
+
+def read_snapshot(json_path: str) -> dict:
+    with open_snapshot(resolve(json_path)) as f:
+        return json.load(f)
+
+
+def write_snapshot(json_path: str, data: dict) -> str:
+    path = snapshot_path(json_path)
+    with SnapshotWriter(path) as writer:
+        writer.write(json.dumps(data, separators=_SEPARATORS).encode())
+    return path
+
+
+class SnapshotWriter(object):
+    """
+    Writes a compressed snapshot from the chunks of a response as they come
+    in. Pretty printed responses lose the whitespace between their tokens
+    on the way (string values are copied as is) and the result replaces the
+    snapshot atomically when the block exits cleanly, an exception discards
+    the partial file:
+
+        with SnapshotWriter(path) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+    """
+
+    def __init__(self, json_path: str, compresslevel: int = COMPRESS_LEVEL):
+        self._path = snapshot_path(json_path)
+        self._tmp_path = self._path + '.tmp'
+        self._file = gzip.open(self._tmp_path, 'wb', compresslevel=compresslevel)
+        # where the previous chunk left off: inside a string, and right
+        # after a backslash in it
+        self._in_string = False
+        self._escaped = False
+        self._committed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None and not self._committed:
+            self.commit()
+        else:
+            self.discard()
+        return False
+
+    def write(self, chunk: bytes):
+        self._file.write(self._minify(chunk))
+
+    def commit(self):
+        self._file.close()
+        os.replace(self._tmp_path, self._path)
+        self._committed = True
+        # the indented original is superseded
+        plain_path = self._path[:-len(SUFFIX)]
+        if os.path.exists(plain_path):
+            os.remove(plain_path)
+
+    def discard(self):
+        if not self._committed:
+            self._file.close()
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+    def _minify(self, chunk: bytes) -> bytes:
+        # drops the whitespace outside strings, the string state carries
+        # over from one chunk to the next
+        if self._escaped or b'\\' in chunk:
+            return self._minify_escaped(chunk)
+        # without backslashes every quote opens or closes a string
+        parts = chunk.split(b'"')
+        outside = 1 if self._in_string else 0
+        parts[outside::2] = [part.translate(None, _WHITESPACE) for part in parts[outside::2]]
+        if len(parts) % 2 == 0:
+            self._in_string = not self._in_string
+        return b'"'.join(parts)
+
+    def _minify_escaped(self, chunk: bytes) -> bytes:
+        out = []
+        pos = 0
+        while pos < len(chunk):
+            end = chunk.find(b'"', pos)
+            if not self._in_string:
+                if end < 0:
+                    out.append(chunk[pos:].translate(None, _WHITESPACE))
+                    break
+                out.append(chunk[pos:end].translate(None, _WHITESPACE) + b'"')
+                self._in_string = True
+                pos = end + 1
+                continue
+            text = chunk[pos:] if end < 0 else chunk[pos:end]
+            # an odd run of backslashes escapes what follows it, a run
+            # covering all of text continues the previous chunk's
+            run = len(text) - len(text.rstrip(b'\\'))
+            escapes = run + self._escaped if run == len(text) else run
+            out.append(text)
+            if end < 0:
+                self._escaped = escapes % 2 == 1
+                break
+            out.append(b'"')
+            self._in_string = escapes % 2 == 1
+            self._escaped = False
+            pos = end + 1
+        return b''.join(out)
+
+
+def _read_time(path: str, repeat: int = 5) -> float:
+    # best of repeat, the file is in the page cache after the first read
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open_snapshot(path) as f:
+            json.load(f)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def migrate(raw_dir: str) -> dict:
+    # rewrites every indented data_*.json in raw_dir as a snapshot and
+    # reports what it saved
+    report = {'files': 0, 'bytes_before': 0, 'bytes_after': 0,
+              'read_s_before': 0.0, 'read_s_after': 0.0}
+    for json_path in sorted(glob.glob(os.path.join(raw_dir, 'data_*.json'))):
+        report['bytes_before'] += os.path.getsize(json_path)
+        report['read_s_before'] += _read_time(json_path)
+        with open(json_path, 'rb') as f:
+            data = json.load(f)
+        mtime_ns = os.stat(json_path).st_mtime_ns
+        path = write_snapshot(json_path, data)
+        # keeps the store copies made from the original fresh (see store.is_fresh)
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+        report['files'] += 1
+        report['bytes_after'] += os.path.getsize(path)
+        report['read_s_after'] += _read_time(path)
+        log.info("Migrated %s -> %s", json_path, path)
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s,%(msecs)d %(levelname)s: %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    # python -m stocktools.snapshot data/data_raw
+    raw_dir = sys.argv[1] if len(sys.argv) > 1 else '../data/data_raw/'
+    report = migrate(raw_dir)
+    if report['files']:
+        print(f"{report['files']} files: "
+              f"{report['bytes_before'] / 2 ** 20:.1f} MiB -> "
+              f"{report['bytes_after'] / 2 ** 20:.1f} MiB on disk, "
+              f"json read {report['read_s_before'] * 1e3:.0f} ms -> "
+              f"{report['read_s_after'] * 1e3:.0f} ms in total")
@@ -0,0 +1,167 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import sys
+import logging
+import numpy as np
+from stocktools.snapshot import raw_files, resolve
+
+# library module, the CLI below configures logging
+log = logging.getLogger(__name__)
+
+# columnar copy of the raw alpha vantage responses, one .npz per symbol:
+#   data/data_raw/data_aapl.json -> data/data_store/data_aapl.npz
+# every array is sorted by ascending date and typed, so loading a symbol
+# is a handful of memcpy's instead of a json parse + str -> float casts
+
+STORE_DIR = 'data_store'
+
+FIELDS = {'1. open': 'Open',
+          '2. high': 'High',
+          '3. low': 'Low',
+          '4. close': 'Close',
+          '5. adjusted close': 'AdjClose',
+          '6. volume': 'Volume',
+          '7. dividend amount': 'DivAmount',
+          '8. split coefficient': 'SplitRatio'}
+
+DTYPES = {'Date': 'datetime64[D]',
+          'Open': 'float64',
+          'High': 'float64',
+          'Low': 'float64',
+          'Close': 'float64',
+          'AdjClose': 'float64',
+          'Volume': 'int64',
+          'DivAmount': 'float64',
+          'SplitRatio': 'float64'}
+
+
+def store_path_for(json_path: str, store_dir: str = None) -> str:
+    # data_raw/data_aapl.json[.gz] -> data_store/data_aapl.npz
+    if store_dir is None:
+        store_dir = os.path.join(os.path.dirname(
+            os.path.dirname(os.path.abspath(json_path))), STORE_DIR)
+    name = os.path.basename(json_path).split('.')[0]
+    return os.path.join(store_dir, f'{name}.npz')
+
+
+def bars_from_response(data: dict) -> dict:
+    time_series = data['Time Series (Daily)']
+    bars = {'Date': np.array(list(time_series.keys()), dtype=DTYPES['Date'])}
+    for key, name in FIELDS.items():
+        values = [day[key] for day in time_series.values()]
+        if DTYPES[name] == 'int64':
+            bars[name] = np.array(values, dtype='float64').astype('int64')
+        else:
+            bars[name] = np.array(values, dtype=DTYPES[name])
+
+    order = np.argsort(bars['Date'], kind='stable')
+    return {name: values[order] for name, values in bars.items()}
+
+
+def read_json_bars(json_path: str) -> dict:
+    # streamed into the columns rather than json.load'ed, see json_stream.py
+    # (imported here, json_stream builds on the constants above)
+    from stocktools.json_stream import decode_file
+    return decode_file(json_path)
+
+
+def write_store(bars: dict, store_path: str):
+    os.makedirs(os.path.dirname(store_path), exist_ok=True)
+    # np.savez appends .npz to names without it, so write to a .npz temp
+    tmp_path = store_path[:-len('.npz')] + '.tmp.npz'
+    np.savez(tmp_path, **bars)
+    os.replace(tmp_path, store_path)
+
+
+def date_slice(dates, start=None, end=None) -> slice:
+    # rows of ascending dates within [start, end], either bound optional
+    lo = 0 if start is None else int(np.searchsorted(
+        dates, np.datetime64(start, 'D'), side='left'))
+    hi = len(dates) if end is None else int(np.searchsorted(
+        dates, np.datetime64(end, 'D'), side='right'))
+    return slice(lo, max(lo, hi))
+
+
+def _read_rows(npz, name: str, rows: slice) -> np.ndarray:
+    # only the rows' bytes of one array: savez stores its members
+    # uncompressed, so they are a .npy header followed by the raw data
+    with npz.zip.open(f'{name}.npy') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            _, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            _, _, dtype = np.lib.format.read_array_header_2_0(f)
+        out = np.empty(rows.stop - rows.start, dtype=dtype)
+        f.seek(rows.start * dtype.itemsize, os.SEEK_CUR)
+        f.readinto(memoryview(out).cast('B'))
+    return out
+
+
+def read_store(store_path: str, columns=None, start=None, end=None) -> dict:
+    # start / end (inclusive dates) read just those rows of each column
+    with np.load(store_path) as npz:
+        names = npz.files if columns is None else columns
+        if start is None and end is None:
+            return {name: npz[name] for name in names}
+        dates = npz['Date']
+        rows = date_slice(dates, start, end)
+        return {name: dates[rows] if name == 'Date' else _read_rows(npz, name, rows)
+                for name in names}
+
+
+def is_fresh(store_path: str, json_path: str) -> bool:
+    # the store is only trusted when it was written after the json it mirrors
+    try:
+        return os.stat(store_path).st_mtime_ns >= \
+            os.stat(resolve(json_path)).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def load_bars(json_path: str, columns=None, start=None, end=None) -> dict:
+    # bars for one symbol from its compacted copy when that is up to date,
+    # otherwise straight from the json; columns and the [start, end] date
+    # range are pushed down into the store read
+    store_path = store_path_for(json_path)
+    if is_fresh(store_path, json_path):
+        return read_store(store_path, columns, start, end)
+    bars = read_json_bars(json_path)
+    rows = date_slice(bars['Date'], start, end)
+    return {name: bars[name][rows] for name in (bars if columns is None else columns)}
+
+
+def compact_json(json_path: str, store_path: str = None) -> str:
+    if store_path is None:
+        store_path = store_path_for(json_path)
+    write_store(read_json_bars(json_path), store_path)
+    log.info("Compacted %s -> %s", json_path, store_path)
+    return store_path
+
+
+def compact_directory(raw_dir: str, store_dir: str = None, stale_only: bool = False) -> list:
+    # stale_only skips the symbols whose store copy is already up to date
+    # (see is_fresh), what the app does on startup
+    written = []
+    for json_path in raw_files(raw_dir).values():
+        store_path = store_path_for(json_path, store_dir)
+        if stale_only and is_fresh(store_path, json_path):
+            continue
+        written.append(compact_json(json_path, store_path))
+    return written
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s,%(msecs)d %(levelname)s: %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    # python -m stocktools.store data/data_raw [data/data_store]
+    raw_dir = sys.argv[1] if len(sys.argv) > 1 else '../data/data_raw/'
+    store_dir = sys.argv[2] if len(sys.argv) > 2 else None
+    compact_directory(raw_dir, store_dir)
@@ -0,0 +1,139 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import time
+import threading
+import contextvars
+from contextlib import nullcontext
+
+# Timing spans around the stages of the hot paths (json_to_df, the
+# main_graph callback, ...):
+#
+#     with span('json_to_df.indicators'):
+#         ...
+#
+# Off unless STOCKTOOLS_TIMING=1 is set, and then span() hands back one
+# shared no-op context manager, so the instrumented code costs a global
+# lookup per stage. When on, every span is added to a per-process histogram
+# served as prometheus text on /metrics, and the spans of the current
+# request are sent back in its Server-Timing header (see install()).
+#
+# Each gunicorn worker keeps its own histograms, /metrics reports the
+# worker that served the scrape.
+
+ENABLED = os.environ.get('STOCKTOOLS_TIMING', '0').lower() not in ('', '0', 'false', 'no')
+
+# histogram bucket upper bounds, seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_NOOP = nullcontext()
+_lock = threading.Lock()
+_histograms = {}  # name -> [bucket counts..., +Inf count], sum
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+
+def enable(enabled: bool = True):
+    global ENABLED
+    ENABLED = enabled
+
+
+class _Span(object):
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name: str):
+    return _Span(name) if ENABLED else _NOOP
+
+
+def record(name: str, seconds: float):
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+    bucket = 0
+    while bucket < len(BUCKETS) and seconds > BUCKETS[bucket]:
+        bucket += 1
+    with _lock:
+        counts, total = _histograms.get(name) or ([0] * (len(BUCKETS) + 1), 0.0)
+        counts[bucket] += 1
+        _histograms[name] = counts, total + seconds
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def snapshot() -> dict:
+    # name -> {'count', 'sum'} of everything recorded so far
+    with _lock:
+        return {name: {'count': sum(counts), 'sum': total}
+                for name, (counts, total) in _histograms.items()}
+
+
+def server_timing(spans) -> str:
+    # Server-Timing header value for [(name, seconds), ...]
+    return ', '.join(f'{name};dur={seconds * 1e3:.2f}' for name, seconds in spans)
+
+
+def metrics_text() -> str:
+    # prometheus text exposition of the span histograms
+    lines = ['# HELP stocktools_span_seconds Time spent in instrumented stages.',
+             '# TYPE stocktools_span_seconds histogram']
+    with _lock:
+        histograms = sorted((name, list(counts), total)
+                            for name, (counts, total) in _histograms.items())
+    for name, counts, total in histograms:
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f'stocktools_span_seconds_bucket{{span="{name}",le="{bound}"}} '
+                         f'{cumulative}')
+        lines.append(f'stocktools_span_seconds_sum{{span="{name}"}} {total:.6f}')
+        lines.append(f'stocktools_span_seconds_count{{span="{name}"}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def install(server):
+    """
+    Adds the Server-Timing header to the flask server's responses and a
+    /metrics route. Does nothing when timing is off.
+    """
+    if not ENABLED:
+        return server
+
+    from flask import Response, g
+
+    @server.before_request
+    def _start_request_spans():
+        g.timing_token = _request_spans.set([])
+        g.timing_start = time.perf_counter()
+
+    @server.after_request
+    def _add_server_timing(response):
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append(('total', time.perf_counter() - g.timing_start))
+            response.headers['Server-Timing'] = server_timing(spans)
+            _request_spans.reset(g.timing_token)
+        return response
+
+    @server.route('/metrics')
+    def _metrics():
+        return Response(metrics_text(), mimetype='text/plain; version=0.0.4')
+
+    return server
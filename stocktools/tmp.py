@@ -6,6 +6,7 @@ import pandas as pd
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
+from stocktools.plotting import ohlc_hovertext
 
 
 def plot_ohlc(co_df: pd.DataFrame, title: str = ""):
@@ -14,14 +15,7 @@ def plot_ohlc(co_df: pd.DataFrame, title: str = ""):
         'background': '#11001A',  # onyx
         'text': '#7FDBFF'
     }
-    hovertext = []
-    for i in range(len(co_df['Open'])):
-        hovertext.append(
-            co_df['Date'][i].strftime("%m/%d/%Y") +
-            '<br>O: '+str(round(co_df['AdjOpen'][i], 4)) +
-            '\tH: '+str(round(co_df['AdjHigh'][i], 4)) +
-            '<br>L: '+str(round(co_df['AdjLow'][i], 4)) +
-            '\tC: '+str(co_df['AdjClose'][i]))
+    hovertext = ohlc_hovertext(co_df)
 
     fig = go.Figure(data=go.Candlestick(x=co_df['Date'],
                                         open=co_df['AdjOpen'],
@@ -9,6 +9,7 @@ import dash_html_components as html
 from dash.dependencies import Input, Output
 from flask import Flask
 from stocktools.json_to_df import json_to_df
+from stocktools.plotting import ohlc_hovertext
 
 
 colors = {
@@ -117,14 +118,7 @@ def make_ohlc_graph(symbolDropdown: str):
                        path=f"data/data_raw/data_{symbolDropdown.lower()}.json")
     # print(co_df)
     title = f"{symbolDropdown.lower()} Historical Graph"
-    hovertext = []
-    for i in range(len(co_df['Open'])):
-        hovertext.append(
-            co_df['Date'][i].strftime("%m/%d/%Y") +
-            '<br>O: '+str(round(co_df['AdjOpen'][i], 4)) +
-            '\tH: '+str(round(co_df['AdjHigh'][i], 4)) +
-            '<br>L: '+str(round(co_df['AdjLow'][i], 4)) +
-            '\tC: '+str(co_df['AdjClose'][i]))
+    hovertext = ohlc_hovertext(co_df)
 
     fig = go.Figure(data=go.Candlestick(x=co_df['Date'],
                                         open=co_df['AdjOpen'],
@@ -0,0 +1,203 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import pandas as pd
+from stocktools import indicators
+from stocktools.json_to_df import json_to_df
+from stocktools.store import load_bars
+from stocktools.snapshot import raw_files
+
+# the whole symbol universe as one date x symbol array per field, aligned on
+# the union of every symbol's trading days (NaN before a symbol listed and
+# on days it has no bar), so indicators run once for all symbols at a time
+
+SYMBOLS: list = ['aapl', 'abt', 'adbe', 'amd', 'amzn', 'baba',
+                 'brkb', 'c', 'cmcsa', 'cost', 'crm', 'dell', 'f', 'fb', 'googl', 'ibm', 'intc',
+                 'intu', 'jnj', 'jpm', 'msft', 'mu', 'nflx', 'nke', 'nvda', 'orcl', 'pfe', 'pg',
+                 'pypl', 'sbux', 't', 'tsla', 'twtr', 'unh', 'v', 'vz', 'wfc', 'wmt']
+
+PANEL_FIELDS = ('AdjOpen', 'AdjHigh', 'AdjLow', 'AdjClose', 'Volume')
+
+Panel = namedtuple('Panel', ['dates', 'symbols', 'fields'])
+
+
+def available_symbols(data_dir: str = '../data/data_raw/') -> list:
+    return list(raw_files(data_dir))
+
+
+def adjusted_fields(bars: dict) -> dict:
+    # one symbol's PANEL_FIELDS from its raw bars, prices scaled by the
+    # vendor's AdjClose / Close
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = bars['AdjClose'] / bars['Close']
+    return {'AdjOpen': bars['Open'] * factor,
+            'AdjHigh': bars['High'] * factor,
+            'AdjLow': bars['Low'] * factor,
+            'AdjClose': bars['AdjClose'],
+            'Volume': bars['Volume'].astype('float64')}
+
+
+def panel_from_bars(bars_by_symbol: dict) -> Panel:
+    symbols = list(bars_by_symbol)
+    dates = np.unique(np.concatenate(
+        [bars['Date'] for bars in bars_by_symbol.values()]))
+    fields = {name: np.full((len(dates), len(symbols)), np.nan)
+              for name in PANEL_FIELDS}
+    for col, symbol in enumerate(symbols):
+        bars = bars_by_symbol[symbol]
+        rows = np.searchsorted(dates, bars['Date'])
+        for name, values in adjusted_fields(bars).items():
+            fields[name][rows, col] = values
+    return Panel(dates, symbols, fields)
+
+
+def load_panel(symbols: list = None, data_dir: str = '../data/data_raw/') -> Panel:
+    if symbols is None:
+        symbols = available_symbols(data_dir)
+    return panel_from_bars({symbol: load_bars(_json_path(data_dir, symbol))
+                            for symbol in symbols})
+
+
+def _json_path(data_dir: str, symbol: str) -> str:
+    return os.path.join(data_dir, f'data_{symbol.lower()}.json')
+
+
+# Frames come back from the loader processes as raw column buffers in one
+# shared memory block per symbol (name + [(column, dtype, offset, length)]),
+# so the parent copies bytes instead of unpickling DataFrames
+_SHARED_ALIGN = 64
+
+
+def _load_shared(json_path: str) -> tuple:
+    # loader process side: json_to_df's frame written to a new shared block
+    df = json_to_df(os.path.basename(json_path), path=json_path)
+    columns = [(name, df[name].to_numpy()) for name in df.columns]
+    layout = []
+    size = 0
+    for name, values in columns:
+        if values.dtype == object:
+            raise TypeError(f'column {name} of {json_path} has no fixed size dtype')
+        layout.append((name, values.dtype.str, size, len(values)))
+        size += -(-values.nbytes // _SHARED_ALIGN) * _SHARED_ALIGN
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for (_, dtype, offset, length), (_, values) in zip(layout, columns):
+            np.ndarray(length, dtype, buffer=block.buf, offset=offset)[:] = values
+    finally:
+        block.close()
+    return block.name, layout
+
+
+def _frame_from_shared(name: str, layout: list) -> pd.DataFrame:
+    # parent side: the frame copied out of the block, which is then freed
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        data = {column: np.ndarray(length, dtype, buffer=block.buf, offset=offset).copy()
+                for column, dtype, offset, length in layout}
+    finally:
+        block.close()
+        block.unlink()
+    return pd.DataFrame(data)
+
+
+def load_universe(symbols: list = None, data_dir: str = '../data/data_raw/',
+                  workers: int = None) -> dict:
+    """
+    symbol -> json_to_df frame for every symbol, parsed and built in
+    `workers` processes (os.cpu_count() by default, 1 loads in process).
+    """
+    if symbols is None:
+        symbols = available_symbols(data_dir)
+    paths = [_json_path(data_dir, symbol) for symbol in symbols]
+    if workers == 1:
+        return {symbol: json_to_df(os.path.basename(path), path=path)
+                for symbol, path in zip(symbols, paths)}
+
+    # the loaders register their blocks with the parent's tracker, which
+    # forgets them again when the parent unlinks them
+    resource_tracker.ensure_running()
+    frames = {}
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_load_shared, path) for path in paths]
+        try:
+            for symbol, future in zip(symbols, futures):
+                frames[symbol] = _frame_from_shared(*future.result())
+        except BaseException:
+            # free the blocks nobody is going to read
+            for future in futures:
+                if future.done() and future.exception() is None:
+                    _discard_shared(future.result()[0])
+            raise
+    return frames
+
+
+def _discard_shared(name: str):
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def _gapless_order(panel: Panel):
+    # row order per column that moves a symbol's missing days to the top and
+    # keeps its trading days in date order below them, so the kernels see
+    # each symbol's own consecutive bars (days another symbol traded and this
+    # one didn't would otherwise count as extra bars for EMAs and diffs)
+    return np.argsort(~np.isnan(panel.fields['AdjClose']), axis=0, kind='stable')
+
+
+def panel_indicators(panel: Panel) -> dict:
+    # every indicator below is one kernel call over all symbols at once
+    order = _gapless_order(panel)
+    close, high, low = (np.take_along_axis(panel.fields[name], order, axis=0)
+                        for name in ('AdjClose', 'AdjHigh', 'AdjLow'))
+    macd_line, macd_signal, macd_hist = indicators.macd(close)
+    bb_lower, _, bb_upper = indicators.bollinger(close)
+    high_52wk, low_52wk = indicators.high_low_52wk(high, low)
+    columns = {'SMA_20day': indicators.sma(close, 20),
+               'EMA_20day': indicators.ema(close, span=20),
+               'MACD': macd_line,
+               'MACD_signal': macd_signal,
+               'MACD_hist': macd_hist,
+               'RSI_14day': indicators.rsi(close, 14),
+               'BB_lower': bb_lower,
+               'BB_upper': bb_upper,
+               'ATR_14day': indicators.atr(high, low, close, 14),
+               '52WkHigh': high_52wk,
+               '52WkLow': low_52wk}
+
+    for name, values in columns.items():
+        aligned = np.empty_like(values)
+        np.put_along_axis(aligned, order, values, axis=0)
+        columns[name] = aligned
+    return columns
+
+
+def split_panel(panel: Panel, columns: dict) -> dict:
+    # one ascending-date frame per symbol holding only the days it traded
+    frames = {}
+    for col, symbol in enumerate(panel.symbols):
+        traded = ~np.isnan(panel.fields['AdjClose'][:, col])
+        data = {'Date': pd.to_datetime(panel.dates[traded])}
+        data.update((name, values[traded, col])
+                    for name, values in panel.fields.items())
+        data.update((name, values[traded, col])
+                    for name, values in columns.items())
+        frames[symbol] = pd.DataFrame(data)
+    return frames
+
+
+def universe_indicators(symbols: list = None,
+                        data_dir: str = '../data/data_raw/') -> dict:
+    panel = load_panel(symbols, data_dir)
+    return split_panel(panel, panel_indicators(panel))
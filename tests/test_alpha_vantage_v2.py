@@ -0,0 +1,68 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import asyncio
+from stocktools.alpha_vantage_v2 import FetchAlphaVantage
+from stocktools.client import FetchResult
+from stocktools.snapshot import snapshot_path, write_snapshot
+from stocktools.store import bars_from_response, load_bars
+from test_json_stream import response
+
+
+class FakeClient(object):
+    # answers with the same response for every symbol, raises for `broken`
+
+    def __init__(self, data: dict, broken=()):
+        self._data = data
+        self._broken = broken
+        self.calls = []
+
+    async def time_series_daily_adjusted(self, symbol, outputsize='full'):
+        self.calls.append((symbol, outputsize))
+        compact = dict(self._data)
+        days = sorted(self._data['Time Series (Daily)'], reverse=True)[:100]
+        compact['Time Series (Daily)'] = {day: self._data['Time Series (Daily)'][day]
+                                          for day in days}
+        return FetchResult(symbol, compact, None, 1)
+
+    async def time_series_bars(self, symbol, outputsize='full', raw_path=None):
+        self.calls.append((symbol, outputsize))
+        if symbol in self._broken:
+            raise RuntimeError(f'no route to {symbol}')
+        write_snapshot(raw_path, self._data)
+        return FetchResult(symbol, bars_from_response(self._data), None, 1)
+
+
+def refresh(raw_dir, client, symbols, incremental=False):
+    fetcher = FetchAlphaVantage('test', 'time_series_daily_adjusted', symbols=symbols,
+                                out_path=raw_dir, incremental=incremental, client=client,
+                                run=False)
+    return {result.symbol: result for result in asyncio.run(fetcher.refresh())}
+
+
+def test_one_failing_symbol_does_not_fail_the_others(tmp_path):
+    raw_dir = os.path.join(tmp_path, 'data_raw')
+    os.makedirs(raw_dir)
+    results = refresh(raw_dir, FakeClient(response(150), broken=('bad',)), ['ok', 'bad'])
+    assert results['ok'].error is None
+    assert len(load_bars(os.path.join(raw_dir, 'data_ok.json'))['Date']) == 150
+    assert results['bad'].data is None and 'no route to bad' in results['bad'].error
+
+
+def test_corrupt_stored_snapshot_is_refetched(tmp_path):
+    raw_dir = os.path.join(tmp_path, 'data_raw')
+    os.makedirs(raw_dir)
+    data = response(150)
+    write_snapshot(os.path.join(raw_dir, 'data_ok.json'), data)
+    with open(snapshot_path(os.path.join(raw_dir, 'data_bad.json')), 'wb') as f:
+        f.write(b'not gzip at all')
+    client = FakeClient(data)
+    results = refresh(raw_dir, client, ['ok', 'bad'], incremental=True)
+    assert all(result.error is None for result in results.values())
+    # the readable one merged the compact window, the corrupt one got it all
+    assert ('ok', 'compact') in client.calls and ('bad', 'full') in client.calls
+    assert len(load_bars(os.path.join(raw_dir, 'data_bad.json'))['Date']) == 150
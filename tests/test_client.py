@@ -0,0 +1,73 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import json
+import asyncio
+from aiohttp import web
+from stocktools.client import AlphaVantageClient
+from stocktools.rate_limit import FakeClock, RateLimiter
+from stocktools.snapshot import read_snapshot, snapshot_path
+from test_json_stream import response
+
+
+async def serve(bodies: list, run):
+    # answers each request with the next body, the last one from then on,
+    # and runs run(client) against it
+    requests = []
+
+    async def handler(request):
+        requests.append(request.query.get('function'))
+        return web.Response(body=bodies[min(len(requests), len(bodies)) - 1],
+                            content_type='application/json')
+
+    app = web.Application()
+    app.router.add_get('/query', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        async with AlphaVantageClient('test', base_url=f'http://127.0.0.1:{port}/query',
+                                      rate_limiter=RateLimiter(clock=FakeClock()),
+                                      backoff=0.001) as client:
+            return await run(client), requests
+    finally:
+        await runner.cleanup()
+
+
+def bodies(days: int = 353):
+    body = json.dumps(response(days), indent=4).encode()
+    return [body[:len(body) // 2], body]
+
+
+def test_truncated_json_is_retried():
+    result, requests = asyncio.run(serve(
+        bodies(), lambda client: client.time_series_daily_adjusted('test')))
+    assert result.error is None and result.attempts == 2
+    assert len(result.data['Time Series (Daily)']) == 353
+    assert len(requests) == 2
+
+
+def test_truncated_stream_is_retried(tmp_path):
+    raw_path = os.path.join(tmp_path, 'data_test.json')
+    result, requests = asyncio.run(serve(
+        bodies(), lambda client: client.time_series_bars('test', raw_path=raw_path)))
+    assert result.error is None and result.attempts == 2
+    assert len(result.data['Date']) == 353
+    # only the complete body made it into the snapshot
+    assert len(read_snapshot(raw_path)['Time Series (Daily)']) == 353
+
+
+def test_truncated_stream_gives_up_without_a_snapshot(tmp_path):
+    raw_path = os.path.join(tmp_path, 'data_test.json')
+    result, requests = asyncio.run(serve(
+        bodies()[:1], lambda client: client.time_series_bars('test', raw_path=raw_path)))
+    assert result.data is None and 'JSONDecodeError' in result.error
+    assert len(requests) == result.attempts == 5
+    assert not os.path.exists(snapshot_path(raw_path))
+    assert os.listdir(tmp_path) == []
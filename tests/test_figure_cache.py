@@ -0,0 +1,30 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import pandas as pd
+from stocktools.figure_cache import FigureCache, snap_range
+from stocktools.plotting import relayout_range
+from test_frame_cache import RAW_DIR
+
+
+def test_unparseable_relayout_shows_everything():
+    assert relayout_range({'xaxis.range[0]': 'not a date',
+                           'xaxis.range[1]': '2020-01-01'}) == 'all'
+    assert relayout_range({'xaxis.range': [None, '2020-01-01']}) == 'all'
+    assert relayout_range({'xaxis.range[0]': '', 'xaxis.range[1]': ''}) == 'all'
+
+
+def test_nearby_pans_share_one_entry(tmp_path):
+    cache = FigureCache(RAW_DIR, directory=str(tmp_path))
+    start = pd.Timestamp('2019-05-19 13:22:11')
+    for shift in range(10):
+        x_range = (start + pd.Timedelta(days=shift), start + pd.Timedelta(days=365 + shift))
+        snapped = snap_range(x_range)
+        assert snapped[0] <= x_range[0] and snapped[1] >= x_range[1]
+        cache.get_json('aapl', x_range)
+    assert cache.misses <= 2 and cache.hits >= 8
+    assert len(os.listdir(tmp_path)) == cache.misses
@@ -0,0 +1,27 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+from stocktools.compact import load_compact
+from stocktools.frame_cache import FrameCache
+
+RAW_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'data', 'data_raw')
+SYMBOLS = ['aapl', 'abt', 'adbe', 'amd', 'amzn', 'c', 'cost', 'ibm']
+
+
+def test_compact_frames_stay_in_bound_as_they_grow():
+    cache = FrameCache(max_bytes=1_000_000, loader=load_compact)
+    for symbol in SYMBOLS:
+        path = os.path.join(RAW_DIR, f'data_{symbol}.json')
+        frame = cache.get(os.path.basename(path), path=path)
+        frame.to_df()
+        for name in ('AdjOpen', 'AdjHigh', 'AdjLow'):
+            frame[name]
+        cache.resize(path)
+        counted = sum(FrameCache._nbytes(entry[1]) for entry in cache._entries.values())
+        assert cache.total_bytes == counted <= 1_000_000
+    assert cache.stats()['entries'] < len(SYMBOLS)
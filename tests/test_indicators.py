@@ -0,0 +1,53 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import math
+import numpy as np
+from stocktools import indicators
+from stocktools.indicators import BollingerState, SMAState
+
+
+def prices(n: int = 300, level: float = 100.0, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return level + np.cumsum(rng.normal(0.0, 1.0, n))
+
+
+def with_gaps(values):
+    # a leading run of NaNs (listed later) and a few missing bars
+    gapped = np.concatenate([np.full(5, np.nan), values])
+    gapped[[40, 41, 120, 250]] = np.nan
+    return gapped
+
+
+def test_states_skip_missing_bars():
+    values = prices()
+    gapped = with_gaps(values)
+    valid = gapped[~np.isnan(gapped)]
+    sma, bands = SMAState(20), BollingerState(20)
+    for x in gapped.tolist():
+        sma.update(x)
+        bands.update(x)
+    # the NaNs are skipped, not carried in the running sums
+    assert math.isclose(sma.value, indicators.sma(valid, 20)[-1], rel_tol=1e-12)
+    expected = [band[-1] for band in indicators.bollinger(valid, 20)]
+    assert np.allclose(bands.value, expected, rtol=1e-12)
+    # seeding from the history lands in the same state
+    assert math.isclose(SMAState.from_history(gapped, 20).value, sma.value, rel_tol=1e-12)
+    assert np.allclose(BollingerState.from_history(gapped, 20).value, bands.value,
+                       rtol=1e-12)
+
+
+def test_bollinger_variance_holds_at_a_high_price_level():
+    # cents of spread around a 1e6 level, where sum(x * x) / n - mean * mean
+    # is off by about the width itself
+    values = 1e6 + prices(2000, level=0.0, seed=1) * 1e-2
+    state = BollingerState(20)
+    for x in values.tolist():
+        state.update(x)
+    lower, middle, upper = state.value
+    width = 2.0 * indicators.rolling_std(values, 20)[-1]
+    assert math.isclose(upper - middle, width, rel_tol=1e-4)
+    assert math.isclose(middle - lower, width, rel_tol=1e-4)
@@ -0,0 +1,55 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import json
+import numpy as np
+import pytest
+from stocktools.json_stream import BarsDecoder
+from stocktools.store import bars_from_response
+
+
+def response(days: int = 30) -> dict:
+    dates = np.arange(np.datetime64('2020-01-01'), np.datetime64('2020-01-01') + days)
+    return {'Meta Data': {'1. Information': 'Daily Time Series with Splits and Dividends',
+                          '2. Symbol': 'TEST'},
+            'Time Series (Daily)': {
+                str(date): {'1. open': f'{100 + i}.0000', '2. high': f'{101 + i}.0000',
+                            '3. low': f'{99 + i}.0000', '4. close': f'{100 + i}.5000',
+                            '5. adjusted close': f'{100 + i}.5000', '6. volume': f'{1000 + i}',
+                            '7. dividend amount': '0.0000', '8. split coefficient': '1.0'}
+                for i, date in enumerate(dates[::-1])}}
+
+
+def decode(body: bytes, chunk_size: int = 97) -> dict:
+    decoder = BarsDecoder(len(body))
+    for start in range(0, len(body), chunk_size):
+        decoder.feed(body[start:start + chunk_size])
+    return decoder.close()
+
+
+@pytest.mark.parametrize('indent', [None, 4])
+def test_whole_body_decodes_like_the_json(indent):
+    data = response()
+    bars = decode(json.dumps(data, indent=indent).encode())
+    expected = bars_from_response(data)
+    for name, values in expected.items():
+        np.testing.assert_array_equal(bars[name], values)
+
+
+@pytest.mark.parametrize('indent', [None, 4])
+def test_truncated_body_raises(indent):
+    body = json.dumps(response(), indent=indent).encode()
+    series = body.index(b'"Time Series (Daily)"')
+    # anywhere from inside the series up to the last byte of the document
+    for cut in list(range(series + 40, len(body), 53)) + [len(body) - 1]:
+        with pytest.raises(json.JSONDecodeError):
+            decode(body[:cut])
+
+
+def test_half_length_body_raises():
+    body = json.dumps(response(353), indent=4).encode()
+    with pytest.raises(json.JSONDecodeError):
+        decode(body[:len(body) // 2])
@@ -0,0 +1,58 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import asyncio
+from stocktools.rate_limit import FakeClock, RateLimiter, simulate
+
+MINUTE = 60.0
+DAY = 24 * 60 * 60.0
+
+
+def assert_within_budget(times, per_minute=5, per_day=500):
+    # call i and call i + capacity can't share a window of `period` seconds
+    times = sorted(times)
+    for capacity, period in ((per_minute, MINUTE), (per_day, DAY)):
+        for first, later in zip(times, times[capacity:]):
+            assert later - first >= period, (capacity, period, first, later)
+
+
+def test_rolling_minute_and_day_budgets():
+    clock = FakeClock()
+    times = asyncio.run(simulate(520, RateLimiter(clock=clock), clock))
+    assert len(times) == 520
+    assert_within_budget(times)
+    # a full bucket bursts, then the 6th call waits out the minute
+    assert times[:5] == [0.0] * 5
+    assert times[5] == MINUTE
+    # the 501st call waits for the first day's first call to expire
+    assert times[500] == DAY
+
+
+def test_state_persists_across_restart(tmp_path):
+    state_path = os.path.join(tmp_path, '.rate_limit.json')
+    clock = FakeClock()
+    before = asyncio.run(simulate(300, RateLimiter(state_path=state_path, clock=clock),
+                                  clock))
+    assert os.path.exists(state_path)
+
+    # a new process picks the budget up from the state file, mid minute
+    clock.advance(1.0)
+    restarted = RateLimiter(state_path=state_path, clock=clock)
+    assert restarted.remaining() == {'minute': 0, 'day': 200}
+    after = asyncio.run(simulate(250, restarted, clock))
+    offset = clock.now - after[-1]
+    assert_within_budget(before + [offset + t for t in after])
+    # past the day's 500 calls the restarted limiter waits for tomorrow
+    assert offset + after[200] >= DAY
+
+
+def test_unreadable_state_is_ignored(tmp_path):
+    state_path = os.path.join(tmp_path, '.rate_limit.json')
+    with open(state_path, 'w') as f:
+        f.write('{not json')
+    limiter = RateLimiter(state_path=state_path, clock=FakeClock())
+    assert limiter.remaining() == {'minute': 5, 'day': 500}
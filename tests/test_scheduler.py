@@ -0,0 +1,58 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+
+import os
+import asyncio
+from stocktools import scheduler
+from stocktools.client import FetchResult
+from stocktools.rate_limit import FakeClock
+
+
+def fake_fetcher(errors: dict, seen: list):
+    # stands in for FetchAlphaVantage: touches the ok symbols' files and
+    # fails the others with errors[symbol]
+
+    class Fetcher(object):
+
+        def __init__(self, api_key, data_feed_type, symbols, out_path, rate_limiter,
+                     **kwargs):
+            self._symbols = symbols
+            self._out_path = out_path
+            seen.append(rate_limiter)
+
+        async def refresh(self):
+            results = []
+            for symbol in self._symbols:
+                if symbol in errors:
+                    results.append(FetchResult(symbol, None, errors[symbol], 1))
+                    continue
+                with open(os.path.join(self._out_path, f'data_{symbol}.json'), 'a') as f:
+                    f.write(' ')
+                results.append(FetchResult(symbol, {}, None, 1))
+            return results
+
+    return Fetcher
+
+
+def test_failures_are_reported_per_symbol(tmp_path, monkeypatch):
+    raw_dir = str(tmp_path)
+    for symbol in ('aapl', 'msft'):
+        with open(os.path.join(raw_dir, f'data_{symbol}.json'), 'w') as f:
+            f.write('{}')
+    errors, seen = {'msft': 'JSONDecodeError: cut short'}, []
+    monkeypatch.setattr(scheduler, 'FetchAlphaVantage', fake_fetcher(errors, seen))
+    state_path = os.path.join(raw_dir, 'budget.json')
+    refresher = scheduler.RefreshScheduler(raw_dir, ['aapl', 'msft'], clock=FakeClock(),
+                                           api_key='test', rate_limit_state=state_path)
+
+    assert asyncio.run(refresher.run_once()) == ['aapl']
+    assert refresher.failures == {'msft': 'JSONDecodeError: cut short'}
+    assert seen[0]._state_path == state_path
+
+    # a symbol leaves the failures on its next good run
+    errors.clear()
+    assert sorted(asyncio.run(refresher.run_once())) == ['aapl', 'msft']
+    assert refresher.failures == {}
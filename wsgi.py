@@ -0,0 +1,12 @@
+"""
+License: MIT
+Copyright (c) 2020 - Sergio Chairez
+"""
+
+# Production entry point, debug off and the data preloaded:
+#
+#     gunicorn -c gunicorn.conf.py wsgi:server
+
+from app import create_app
+
+server = application = create_app()